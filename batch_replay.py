@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Replay chat transcripts through the AI Assistant with batched LLM calls.
+
+Usage:
+    python batch_replay.py transcripts.jsonl [--max-concurrency 16]
+
+Each input line is a JSON object with a "conversation" id and a "message".
+Every conversation gets a fresh booking session, its messages are replayed
+in order, and one JSON line per message is written to stdout.
+"""
+
+import argparse
+import asyncio
+import sys
+from typing import Dict, List, Tuple
+
+import orjson
+
+from src.config import get_settings
+from src.services import AIAssistantService, create_response_cache, create_session_manager
+
+def load_transcripts(path: str) -> List[Tuple[str, str]]:
+    """Read (conversation id, message) pairs from a JSON Lines file."""
+    turns = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                data = orjson.loads(line)
+                turns.append((str(data["conversation"]), data["message"]))
+    return turns
+
+async def replay(path: str, max_concurrency: int):
+    settings = get_settings()
+    session_manager = create_session_manager(settings)
+    ai_assistant = AIAssistantService(
+        openai_api_key=settings.openai_api_key,
+        session_manager=session_manager,
+        response_cache=create_response_cache(settings),
+        database_path=settings.database_path
+    )
+
+    turns = load_transcripts(path)
+
+    # One new session per conversation
+    session_ids: Dict[str, str] = {}
+    for conversation, _ in turns:
+        if conversation not in session_ids:
+            session_ids[conversation] = session_manager.create_session(metadata={"replay": conversation}).session_id
+
+    replies = await ai_assistant.aprocess_messages(
+        [(session_ids[conversation], message) for conversation, message in turns],
+        max_concurrency=max_concurrency
+    )
+
+    for (conversation, message), reply in zip(turns, replies):
+        sys.stdout.buffer.write(orjson.dumps({
+            "conversation": conversation,
+            "session_id": session_ids[conversation],
+            "message": message,
+            "response": reply
+        }) + b"\n")
+
+    for conversation, session_id in session_ids.items():
+        session = session_manager.get_session(session_id)
+        print(f"{conversation}: {session.current_step.value}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay chat transcripts with batched LLM calls.")
+    parser.add_argument("transcripts", help="JSON Lines file with conversation and message fields")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="Maximum concurrent LLM requests")
+    args = parser.parse_args()
+
+    asyncio.run(replay(args.transcripts, args.max_concurrency))
+
+if __name__ == "__main__":
+    main()
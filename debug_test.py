@@ -3,24 +3,20 @@
 Debug script to test AI Assistant service directly.
 """
 
-import os
 import sys
-from dotenv import load_dotenv
 
 # Add src to path
 sys.path.append('src')
 
+from src.config import get_settings
 from src.services.session_manager import SessionManager
 from src.services.ai_assistant import AIAssistantService
 
 def main():
-    # Load environment variables
-    load_dotenv()
-    
     # Initialize services
     session_manager = SessionManager()
     ai_assistant = AIAssistantService(
-        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        openai_api_key=get_settings().openai_api_key,
         session_manager=session_manager
     )
     
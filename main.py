@@ -2,15 +2,18 @@
 Main application entry point for the Medical Appointment Booking System.
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 import os
 import logging
 
-from src.api import router
+from src.api import router, load_index_html, LegacyPathRewriteMiddleware
 from src.config import get_settings
+from src.services import AIAssistantService, create_response_cache, create_session_manager
 
 # Configure logging
 logging.basicConfig(
@@ -19,6 +22,44 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown tasks."""
+    settings = get_settings()
+    logger.info(f"Starting {settings.app_name} v{settings.app_version}")
+    
+    # Initialize services (one set per worker process)
+    app.state.session_manager = create_session_manager(settings)
+    
+    if settings.storage_backend == "file":
+        # Ensure data directories exist
+        for directory in (
+            settings.data_directory,
+            settings.sessions_directory,
+            settings.chat_history_directory,
+            settings.appointments_directory
+        ):
+            os.makedirs(directory, exist_ok=True)
+    elif settings.storage_backend == "redis":
+        # Check the Redis connection instead of touching the filesystem
+        try:
+            app.state.session_manager.redis.ping()
+        except Exception as e:
+            logger.error(f"Redis is not reachable at {settings.redis_url}: {e}")
+    app.state.ai_assistant = AIAssistantService(
+        openai_api_key=settings.openai_api_key or "your-openai-api-key",
+        session_manager=app.state.session_manager,
+        response_cache=create_response_cache(settings),
+        database_path=settings.database_path
+    )
+    
+    # Cache the chat interface page; it does not change at runtime
+    app.state.index_html = load_index_html()
+    
+    logger.info("Application startup complete")
+    yield
+    logger.info("Application shutting down")
+
 def create_app() -> FastAPI:
     """Create and configure the FastAPI application."""
     settings = get_settings()
@@ -28,16 +69,22 @@ def create_app() -> FastAPI:
         version=settings.app_version,
         description="Professional AI-powered medical appointment booking system with session management",
         docs_url="/docs",
-        redoc_url="/redoc"
+        redoc_url="/redoc",
+        lifespan=lifespan
     )
     
+    # Compress larger responses (session lists, chat histories, HTML)
+    app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+    
     # Add CORS middleware
     app.add_middleware(
         CORSMiddleware,
         allow_origins=settings.cors_origins,
-        allow_credentials=True,
+        # Credentials are not valid with a wildcard origin
+        allow_credentials="*" not in settings.cors_origins,
         allow_methods=settings.cors_methods,
         allow_headers=settings.cors_headers,
+        max_age=3600,
     )
     
     # Mount static files if directory exists
@@ -46,27 +93,13 @@ def create_app() -> FastAPI:
     
     # Include API routes
     app.include_router(router, prefix="/api/v1")
-    app.include_router(router)  # Also include without prefix for backward compatibility
-    
-    # Startup event
-    @app.on_event("startup")
-    async def startup_event():
-        """Application startup tasks."""
-        logger.info(f"Starting {settings.app_name} v{settings.app_version}")
-        
-        # Ensure data directories exist
-        os.makedirs(settings.data_directory, exist_ok=True)
-        os.makedirs(settings.sessions_directory, exist_ok=True)
-        os.makedirs(settings.chat_history_directory, exist_ok=True)
-        os.makedirs(settings.appointments_directory, exist_ok=True)
-        
-        logger.info("Application startup complete")
     
-    # Shutdown event
-    @app.on_event("shutdown")
-    async def shutdown_event():
-        """Application shutdown tasks."""
-        logger.info("Application shutting down")
+    # Serve the unprefixed paths for backward compatibility
+    app.add_middleware(
+        LegacyPathRewriteMiddleware,
+        prefix="/api/v1",
+        exclude=("/docs", "/redoc", "/openapi.json", "/static")
+    )
     
     return app
 
@@ -76,12 +109,18 @@ app = create_app()
 if __name__ == "__main__":
     settings = get_settings()
     
-    logger.info(f"Starting server on {settings.host}:{settings.port}")
+    logger.info(f"Starting server on {settings.host}:{settings.port} ({settings.workers} workers)")
     
     uvicorn.run(
         "main:app",
         host=settings.host,
         port=settings.port,
         reload=settings.reload,
-        log_level=settings.log_level.lower()
+        workers=None if settings.reload else settings.workers,
+        log_level=settings.log_level.lower(),
+        # "auto" uses uvloop and httptools when installed (uvicorn[standard]
+        # installs them where the platform supports them)
+        loop="auto",
+        http="auto",
+        ws="websockets"
     ) 
\ No newline at end of file
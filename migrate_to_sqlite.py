@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Copy file-based sessions, chat history and appointments into the SQLite store.
+
+Usage:
+    python migrate_to_sqlite.py
+
+Reads the directories configured in the settings and writes to
+DATABASE_PATH. Rows that already exist are replaced, so the script can be
+run again safely. Set STORAGE_BACKEND=sqlite afterwards to use the database.
+"""
+
+from src.config import get_settings
+from src.services import (
+    AppointmentService, Database, SessionManager, SQLiteAppointmentService, SQLiteSessionManager
+)
+
+def main():
+    settings = get_settings()
+    database = Database(settings.database_path)
+
+    file_sessions = SessionManager(
+        storage_path=settings.sessions_directory,
+        session_timeout_hours=settings.session_timeout_hours
+    )
+    sqlite_sessions = SQLiteSessionManager(database, session_timeout_hours=settings.session_timeout_hours)
+
+    session_count = 0
+    message_count = 0
+    for session in file_sessions.iter_sessions():
+        messages = file_sessions.chat_history_service.get_session_messages(session.session_id)
+        with database.transaction() as conn:
+            conn.execute("DELETE FROM chat_messages WHERE session_id = ?", (session.session_id,))
+            sqlite_sessions.chat_history_service._insert_messages(conn, messages)
+            sqlite_sessions._upsert_session(conn, session)
+        session_count += 1
+        message_count += len(messages)
+    print(f"Migrated {session_count} sessions with {message_count} messages")
+
+    sqlite_appointments = SQLiteAppointmentService(database)
+    appointments = AppointmentService(storage_path=settings.appointments_directory).get_all_appointments()
+    for appointment in appointments:
+        sqlite_appointments._save_appointment(appointment)
+    print(f"Migrated {len(appointments)} appointments")
+
+    print(f"Data written to {settings.database_path}")
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ import sys
 import time
 import signal
 import os
+import urllib.request
 from threading import Thread
 from dotenv import load_dotenv
 
@@ -26,11 +27,25 @@ def run_fastapi():
     except KeyboardInterrupt:
         print("🛑 FastAPI server stopped")
 
+def wait_for_fastapi(timeout: float = 15.0) -> bool:
+    """Poll the FastAPI health endpoint until it responds or the timeout expires."""
+    health_url = f"http://127.0.0.1:{os.getenv('PORT', '8001')}/health"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(health_url, timeout=0.2):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
 def run_streamlit():
     """Run the Streamlit frontend."""
+    # Wait for FastAPI to accept requests
+    if not wait_for_fastapi():
+        print("⚠️  FastAPI backend is not responding yet, starting Streamlit anyway")
+    
     print("🎨 Starting Streamlit frontend...")
-    # Wait a bit for FastAPI to start
-    time.sleep(3)
     
     # Get port from environment
     streamlit_port = os.getenv("STREAMLIT_PORT", "8501")
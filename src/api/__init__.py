@@ -2,6 +2,7 @@
 API endpoints for the medical appointment booking system.
 """
 
-from .routes import router
+from .routes import router, load_index_html
+from .middleware import LegacyPathRewriteMiddleware
 
-__all__ = ["router"] 
\ No newline at end of file
+__all__ = ["router", "load_index_html", "LegacyPathRewriteMiddleware"] 
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""
+ASGI middleware for the medical appointment booking system.
+"""
+
+from typing import Iterable
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+class LegacyPathRewriteMiddleware:
+    """Rewrite unprefixed legacy API paths (e.g. ``/chat``) onto the versioned prefix.
+    
+    The API router is only registered under ``prefix``; older clients that call
+    the bare paths are mapped onto it with a cheap string check per request
+    instead of registering every route twice.
+    """
+    
+    def __init__(self, app: ASGIApp, prefix: str = "/api/v1", exclude: Iterable[str] = ()):
+        self.app = app
+        self.prefix = prefix
+        self.exclude = tuple(exclude)
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] in ("http", "websocket"):
+            path = scope["path"]
+            if not path.startswith(self.prefix) and not path.startswith(self.exclude):
+                scope = dict(scope)
+                scope["path"] = self.prefix + path
+                if scope.get("raw_path"):
+                    scope["raw_path"] = self.prefix.encode() + scope["raw_path"]
+        await self.app(scope, receive, send)
@@ -2,33 +2,44 @@
 API routes for the medical appointment booking system.
 """
 
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from typing import Dict, List
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.requests import HTTPConnection
+from fastapi.responses import HTMLResponse, StreamingResponse
+from itertools import islice
+from typing import Dict, List, Optional
+import asyncio
 import os
 
-from ..models import (
-    SessionCreateRequest, SessionCreateResponse, ChatRequest, ChatResponse,
-    ChatHistoryResponse, MessageType, SessionStatus
-)
-from ..services import SessionManager, AIAssistantService
-from dotenv import load_dotenv
+import orjson
 
-load_dotenv()
-
-# Initialize services
-session_manager = SessionManager()
-ai_assistant = AIAssistantService(
-    openai_api_key=os.getenv("OPENAI_API_KEY", "your-openai-api-key"),
-    session_manager=session_manager
+from ..models import (
+    SessionCreateRequest, SessionCreateResponse, ChatRequest, ChatBatchRequest, ChatResponse,
+    ChatHistoryResponse, SessionStatus
 )
+from ..services import BaseSessionManager, AIAssistantService
 
 # Create router
 router = APIRouter()
 
+# Maximum number of received messages waiting to be processed per WebSocket connection
+MAX_QUEUED_WS_MESSAGES = 16
+
+# Service dependencies
+# Services are built once per worker process in the application lifespan
+# (see main.py) and stored on app.state.
+def get_session_manager(connection: HTTPConnection) -> BaseSessionManager:
+    """Get the session manager for the running application."""
+    return connection.app.state.session_manager
+
+def get_ai_assistant(connection: HTTPConnection) -> AIAssistantService:
+    """Get the AI assistant for the running application."""
+    return connection.app.state.ai_assistant
+
 # Session Management Endpoints
 @router.post("/sessions", response_model=SessionCreateResponse)
-async def create_session(request: SessionCreateRequest):
+async def create_session(request: SessionCreateRequest, session_manager: BaseSessionManager = Depends(get_session_manager)):
     """Create a new booking session."""
     try:
         session = session_manager.create_session(
@@ -47,7 +58,7 @@ async def create_session(request: SessionCreateRequest):
         raise HTTPException(status_code=500, detail=f"Failed to create session: {str(e)}")
 
 @router.get("/sessions/{session_id}")
-async def get_session(session_id: str):
+async def get_session(session_id: str, session_manager: BaseSessionManager = Depends(get_session_manager)):
     """Get session information."""
     session = session_manager.get_session(session_id)
     if not session:
@@ -64,46 +75,59 @@ async def get_session(session_id: str):
     }
 
 @router.get("/sessions")
-async def list_sessions(status: SessionStatus = None):
-    """List all sessions with optional status filter."""
-    sessions = session_manager.get_all_sessions(status_filter=status)
-    return {
-        "sessions": [
-            {
+async def list_sessions(
+    status: SessionStatus = None,
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of sessions to return"),
+    offset: int = Query(0, ge=0, description="Number of sessions to skip"),
+    session_manager: BaseSessionManager = Depends(get_session_manager)
+):
+    """List sessions with optional status filter and pagination.
+    
+    The response is streamed one session at a time so the full list is
+    never held in memory; sessions after the requested page are not loaded.
+    """
+    def generate():
+        count = 0
+        yield b'{"sessions":['
+        sessions = session_manager.iter_sessions(status_filter=status)
+        for s in islice(sessions, offset, None if limit is None else offset + limit):
+            if count:
+                yield b','
+            yield orjson.dumps({
                 "session_id": s.session_id,
                 "status": s.status,
                 "current_step": s.current_step,
                 "patient_name": s.patient_info.name,
                 "created_at": s.created_at,
                 "updated_at": s.updated_at
-            }
-            for s in sessions
-        ],
-        "total": len(sessions)
-    }
+            })
+            count += 1
+        total = session_manager.count_sessions(status_filter=status)
+        yield b'],"count":' + str(count).encode() + b',"total":' + str(total).encode() + b'}'
+    
+    return StreamingResponse(generate(), media_type="application/json")
 
 @router.delete("/sessions/{session_id}")
-async def delete_session(session_id: str):
+async def delete_session(session_id: str, session_manager: BaseSessionManager = Depends(get_session_manager)):
     """Delete a session and its chat history."""
     session = session_manager.get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Delete chat history
-    session_manager.chat_history_service.delete_session_history(session_id)
-    
-    # Delete session file
-    session_file = session_manager._get_session_file_path(session_id)
-    if os.path.exists(session_file):
-        os.remove(session_file)
+    if not session_manager.delete_session(session_id):
+        raise HTTPException(status_code=500, detail="Failed to delete session")
     
     return {"message": "Session deleted successfully"}
 
 # Chat Endpoints
 @router.post("/chat", response_model=ChatResponse)
-async def send_chat_message(request: ChatRequest):
+async def send_chat_message(
+    request: ChatRequest,
+    session_manager: BaseSessionManager = Depends(get_session_manager),
+    ai_assistant: AIAssistantService = Depends(get_ai_assistant)
+):
     """Send a chat message and get AI response."""
-    session = session_manager.get_session(request.session_id)
+    session = await run_in_threadpool(session_manager.get_session, request.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -111,45 +135,119 @@ async def send_chat_message(request: ChatRequest):
         raise HTTPException(status_code=400, detail=f"Session is {session.status.value}")
     
     try:
-        # Save user message
-        user_message = session_manager.save_chat_message(
-            session_id=request.session_id,
-            message_type=MessageType.USER,
-            content=request.message,
-            metadata=request.metadata
-        )
-        
-        # Generate AI response
-        ai_response_text = ai_assistant.process_message(request.session_id, request.message)
-        
-        # Save AI response
-        ai_message = session_manager.save_chat_message(
-            session_id=request.session_id,
-            message_type=MessageType.ASSISTANT,
-            content=ai_response_text
+        # The turn is saved in one flush and the session is updated in place
+        ai_message = await ai_assistant.aprocess_turn(
+            request.session_id, request.message, session, request.metadata
         )
         
-        # Get updated session
-        updated_session = session_manager.get_session(request.session_id)
-        
         return ChatResponse(
             session_id=request.session_id,
-            message_id=ai_message.id if ai_message else "unknown",
+            message_id=ai_message.id,
             user_message=request.message,
-            assistant_response=ai_response_text,
-            current_step=updated_session.current_step,
-            patient_info=updated_session.patient_info,
-            timestamp=ai_message.timestamp if ai_message else None,
-            session_status=updated_session.status
+            assistant_response=ai_message.content,
+            current_step=session.current_step,
+            patient_info=session.patient_info,
+            timestamp=ai_message.timestamp,
+            session_status=session.status
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process message: {str(e)}")
 
+@router.post("/chat/batch", response_model=List[ChatResponse])
+async def send_chat_messages(
+    request: ChatBatchRequest,
+    session_manager: BaseSessionManager = Depends(get_session_manager),
+    ai_assistant: AIAssistantService = Depends(get_ai_assistant)
+):
+    """Send several chat messages of one session and get a response to each.
+    
+    The messages are processed in order, each turn seeing the state left
+    by the previous one, so a scripted conversation needs one round trip.
+    The batch is not atomic: it stops at the first failed turn, and the
+    error detail lists the responses of the turns already saved along with
+    the index of the failed message.
+    """
+    session = await run_in_threadpool(session_manager.get_session, request.session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    if session.status != SessionStatus.ACTIVE:
+        raise HTTPException(status_code=400, detail=f"Session is {session.status.value}")
+    
+    responses = []
+    try:
+        for message in request.messages:
+            ai_message = await ai_assistant.aprocess_turn(
+                request.session_id, message, session, request.metadata
+            )
+            responses.append(ChatResponse(
+                session_id=request.session_id,
+                message_id=ai_message.id,
+                user_message=message,
+                assistant_response=ai_message.content,
+                current_step=session.current_step,
+                # The session is updated in place, so keep this turn's snapshot
+                patient_info=session.patient_info.model_copy(),
+                timestamp=ai_message.timestamp,
+                session_status=session.status
+            ))
+        
+        return responses
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail={
+            "message": f"Failed to process messages: {str(e)}",
+            "failed_index": len(responses),
+            "responses": jsonable_encoder(responses)
+        })
+
+@router.post("/chat/stream")
+async def stream_chat_message(
+    request: ChatRequest,
+    session_manager: BaseSessionManager = Depends(get_session_manager),
+    ai_assistant: AIAssistantService = Depends(get_ai_assistant)
+):
+    """Send a chat message and stream the AI response as Server-Sent Events.
+    
+    Each event carries a {"token": ...} chunk of the reply. A final
+    {"done": true, ...} event carries the updated step and patient info.
+    """
+    session = await run_in_threadpool(session_manager.get_session, request.session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    if session.status != SessionStatus.ACTIVE:
+        raise HTTPException(status_code=400, detail=f"Session is {session.status.value}")
+    
+    async def generate():
+        try:
+            async for token in ai_assistant.astream_turn(
+                request.session_id, request.message, session, request.metadata
+            ):
+                yield b"data: " + orjson.dumps({"token": token}) + b"\n\n"
+        except Exception as e:
+            yield b"data: " + orjson.dumps({"error": f"Failed to process message: {str(e)}"}) + b"\n\n"
+            return
+        
+        yield b"data: " + orjson.dumps({
+            "done": True,
+            "current_step": session.current_step,
+            "patient_info": session.patient_info.model_dump(),
+            "session_status": session.status
+        }) + b"\n\n"
+    
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
 @router.get("/chat-history/{session_id}", response_model=ChatHistoryResponse)
-async def get_chat_history(session_id: str):
-    """Get chat history for a session."""
-    history = session_manager.get_chat_history(session_id)
+async def get_chat_history(
+    session_id: str,
+    since: int = Query(0, ge=0, description="Number of leading messages to skip"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of most recent messages to return"),
+    session_manager: BaseSessionManager = Depends(get_session_manager)
+):
+    """Get chat history for a session, optionally only the messages after `since` or the last `limit`."""
+    history = session_manager.get_chat_history(session_id, since, limit)
     if not history:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -157,7 +255,7 @@ async def get_chat_history(session_id: str):
 
 # Utility Endpoints
 @router.post("/cleanup")
-async def cleanup_expired_sessions():
+async def cleanup_expired_sessions(session_manager: BaseSessionManager = Depends(get_session_manager)):
     """Clean up expired sessions."""
     cleaned_count = session_manager.cleanup_expired_sessions()
     return {"message": f"Cleaned up {cleaned_count} expired sessions"}
@@ -168,78 +266,102 @@ async def health_check():
     return {"status": "healthy", "service": "Medical Appointment Booking API"}
 
 # WebSocket endpoint
+async def receive_frame(websocket: WebSocket) -> Dict:
+    """Receive a JSON frame from the client.
+    
+    Responses are sent as binary orjson frames; clients may send either
+    binary or text frames.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    return orjson.loads(message.get("bytes") or message.get("text") or "{}")
+
 @router.websocket("/ws/{session_id}")
-async def websocket_endpoint(websocket: WebSocket, session_id: str):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    session_id: str,
+    session_manager: BaseSessionManager = Depends(get_session_manager),
+    ai_assistant: AIAssistantService = Depends(get_ai_assistant)
+):
     """WebSocket endpoint for real-time chat."""
     await websocket.accept()
     
     # Verify session exists
-    session = session_manager.get_session(session_id)
+    session = await run_in_threadpool(session_manager.get_session, session_id)
     if not session:
-        await websocket.send_json({"error": "Session not found"})
+        await websocket.send_bytes(orjson.dumps({"error": "Session not found"}))
         await websocket.close()
         return
     
+    # Received messages are queued so a slow AI call does not stop the
+    # connection from receiving further frames; a single consumer handles
+    # them one at a time, so turns of the session never overlap and replies
+    # arrive in the order the messages were sent
+    queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_QUEUED_WS_MESSAGES)
+    
+    async def process_messages():
+        while True:
+            user_message = await queue.get()
+            try:
+                # The turn is saved in one flush and the session is updated in place
+                updated_session = await run_in_threadpool(session_manager.get_session, session_id)
+                ai_message = await ai_assistant.aprocess_turn(session_id, user_message, updated_session)
+                
+                # Send response to client
+                # (orjson serializes the str enums directly, no .value needed)
+                await websocket.send_bytes(orjson.dumps({
+                    "type": "assistant_response",
+                    "message": ai_message.content,
+                    "current_step": updated_session.current_step,
+                    "patient_info": updated_session.patient_info.model_dump(),
+                    "session_status": updated_session.status
+                }))
+            except Exception as e:
+                print(f"WebSocket error: {e}")
+                await websocket.send_bytes(orjson.dumps({"error": str(e)}))
+    
+    consumer = asyncio.create_task(process_messages())
+    
     try:
         while True:
             # Receive message from client
-            data = await websocket.receive_json()
+            data = await receive_frame(websocket)
             user_message = data.get("message", "")
             
             if not user_message:
                 continue
             
-            # Save user message
-            session_manager.save_chat_message(
-                session_id=session_id,
-                message_type=MessageType.USER,
-                content=user_message
-            )
-            
-            # Generate AI response
-            ai_response = ai_assistant.process_message(session_id, user_message)
-            
-            # Save AI response
-            session_manager.save_chat_message(
-                session_id=session_id,
-                message_type=MessageType.ASSISTANT,
-                content=ai_response
-            )
-            
-            # Get updated session
-            updated_session = session_manager.get_session(session_id)
-            
-            # Send response to client
-            await websocket.send_json({
-                "type": "assistant_response",
-                "message": ai_response,
-                "current_step": updated_session.current_step.value,
-                "patient_info": updated_session.patient_info.dict(),
-                "session_status": updated_session.status.value
-            })
+            await queue.put(user_message)
             
     except WebSocketDisconnect:
         print(f"WebSocket disconnected for session {session_id}")
     except Exception as e:
         print(f"WebSocket error: {e}")
-        await websocket.send_json({"error": str(e)})
+        await websocket.send_bytes(orjson.dumps({"error": str(e)}))
+    finally:
+        consumer.cancel()
 
 # Static file serving
-@router.get("/", response_class=HTMLResponse)
-async def serve_chat_interface():
-    """Serve the chat interface."""
-    html_file = "static/index.html"
+FALLBACK_INDEX_HTML = """
+<html>
+    <head><title>Medical Appointment Booking</title></head>
+    <body>
+        <h1>Medical Appointment Booking System</h1>
+        <p>Chat interface not found. Please ensure static/index.html exists.</p>
+        <p>API is running at <a href="/docs">/docs</a></p>
+    </body>
+</html>
+"""
+
+def load_index_html(html_file: str = "static/index.html") -> str:
+    """Read the chat interface once so it can be served from memory."""
     if os.path.exists(html_file):
         with open(html_file, 'r') as f:
-            return HTMLResponse(content=f.read())
-    else:
-        return HTMLResponse(content="""
-        <html>
-            <head><title>Medical Appointment Booking</title></head>
-            <body>
-                <h1>Medical Appointment Booking System</h1>
-                <p>Chat interface not found. Please ensure static/index.html exists.</p>
-                <p>API is running at <a href="/docs">/docs</a></p>
-            </body>
-        </html>
-        """) 
\ No newline at end of file
+            return f.read()
+    return FALLBACK_INDEX_HTML
+
+@router.get("/", response_class=HTMLResponse)
+async def serve_chat_interface(connection: HTTPConnection):
+    """Serve the chat interface."""
+    return HTMLResponse(content=connection.app.state.index_html)
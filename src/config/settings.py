@@ -3,8 +3,9 @@ Application settings and configuration.
 """
 
 from pydantic_settings import BaseSettings
-from typing import Optional, Union, List
-from pydantic import field_validator
+from typing import Union, List, Literal
+from pydantic import AliasChoices, Field, field_validator
+from functools import lru_cache
 import os
 
 class Settings(BaseSettings):
@@ -24,7 +25,13 @@ class Settings(BaseSettings):
     session_timeout_hours: int = 24
     max_sessions_per_user: int = 5
     
+    # AI Response Cache Configuration
+    response_cache_ttl_seconds: int = 3600
+    
     # Storage Configuration
+    storage_backend: Literal["file", "redis", "sqlite"] = "file"
+    redis_url: str = "redis://localhost:6379/0"
+    database_path: str = "data/medscheduler.sqlite3"
     data_directory: str = "data"
     sessions_directory: str = "data/sessions"
     chat_history_directory: str = "data/chat_history"
@@ -35,10 +42,14 @@ class Settings(BaseSettings):
     port: int = 8001
     streamlit_port: int = 8501
     reload: bool = False
+    workers: int = Field(
+        default_factory=lambda: max(2, (os.cpu_count() or 1) * 2 + 1),
+        validation_alias=AliasChoices("WEB_CONCURRENCY", "WORKERS")
+    )
     
     # CORS Configuration
-    cors_origins: Union[str, List[str]] = "*"
-    cors_methods: Union[str, List[str]] = "*"
+    cors_origins: Union[str, List[str]] = "http://localhost:8501"
+    cors_methods: Union[str, List[str]] = "GET,POST,DELETE,OPTIONS"
     cors_headers: Union[str, List[str]] = "*"
     
     @field_validator('cors_origins', 'cors_methods', 'cors_headers', mode='before')
@@ -61,12 +72,7 @@ class Settings(BaseSettings):
         env_file_encoding = "utf-8"
         extra = "ignore"  # Ignore extra environment variables
 
-# Global settings instance
-_settings: Optional[Settings] = None
-
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
     """Get application settings singleton."""
-    global _settings
-    if _settings is None:
-        _settings = Settings()
-    return _settings 
\ No newline at end of file
+    return Settings() 
\ No newline at end of file
@@ -18,6 +18,7 @@ from .session import (
 from .chat import (
     ChatMessage,
     ChatRequest,
+    ChatBatchRequest,
     ChatResponse,
     ChatHistoryResponse
 )
@@ -42,6 +43,7 @@ __all__ = [
     # Chat models
     "ChatMessage",
     "ChatRequest",
+    "ChatBatchRequest",
     "ChatResponse",
     "ChatHistoryResponse",
     
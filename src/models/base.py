@@ -2,7 +2,19 @@
 Base models and enums for the medical appointment booking system.
 """
 
+from datetime import datetime, timezone
 from enum import Enum
+from typing import Optional
+
+def utc_now() -> datetime:
+    """Get the current time as a timezone-aware UTC datetime."""
+    return datetime.now(timezone.utc)
+
+def ensure_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Convert a datetime to aware UTC; naive values (older records) are taken as local time."""
+    if value is None:
+        return None
+    return value.astimezone(timezone.utc)
 
 class MessageType(str, Enum):
     """Types of messages in the chat system."""
@@ -2,12 +2,12 @@
 Chat-related data models.
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 import uuid
 
-from .base import MessageType, BookingStep, SessionStatus
+from .base import MessageType, BookingStep, SessionStatus, utc_now, ensure_utc
 from .session import PatientInfo
 
 class ChatMessage(BaseModel):
@@ -16,15 +16,30 @@ class ChatMessage(BaseModel):
     session_id: str
     message_type: MessageType
     content: str
-    timestamp: datetime = Field(default_factory=datetime.now)
+    timestamp: datetime = Field(default_factory=utc_now)
     metadata: Optional[Dict[str, Any]] = None
+    
+    normalize_timestamps = field_validator('timestamp')(ensure_utc)
 
 class ChatRequest(BaseModel):
     """Request model for sending a chat message."""
     session_id: str
-    message: str
+    message: str = Field(..., min_length=1)
     metadata: Optional[Dict[str, Any]] = None
 
+class ChatBatchRequest(BaseModel):
+    """Request model for sending several chat messages of one session in order."""
+    session_id: str
+    messages: List[str] = Field(..., min_length=1)
+    metadata: Optional[Dict[str, Any]] = None
+    
+    @field_validator('messages')
+    @classmethod
+    def messages_not_empty(cls, messages: List[str]) -> List[str]:
+        if any(not message for message in messages):
+            raise ValueError("messages must not be empty")
+        return messages
+
 class ChatResponse(BaseModel):
     """Response model for chat interactions."""
     session_id: str
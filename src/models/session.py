@@ -2,12 +2,12 @@
 Session-related data models.
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, Dict, Any
 from datetime import datetime
 import uuid
 
-from .base import SessionStatus, BookingStep
+from .base import SessionStatus, BookingStep, utc_now, ensure_utc
 
 class PatientInfo(BaseModel):
     """Patient information collected during the booking process."""
@@ -23,13 +23,15 @@ class PatientInfo(BaseModel):
 class SessionData(BaseModel):
     """Complete session data structure."""
     session_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    created_at: datetime = Field(default_factory=datetime.now)
-    updated_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=utc_now)
+    updated_at: datetime = Field(default_factory=utc_now)
     status: SessionStatus = SessionStatus.ACTIVE
     current_step: BookingStep = BookingStep.GREETING
     patient_info: PatientInfo = Field(default_factory=PatientInfo)
     metadata: Optional[Dict[str, Any]] = None
     expires_at: Optional[datetime] = None
+    
+    normalize_timestamps = field_validator('created_at', 'updated_at', 'expires_at')(ensure_utc)
 
 class SessionCreateRequest(BaseModel):
     """Request model for creating a new session."""
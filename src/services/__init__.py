@@ -2,14 +2,33 @@
 Business logic services for the medical appointment booking system.
 """
 
-from .session_manager import SessionManager
-from .chat_history import ChatHistoryService
-from .appointment import AppointmentService
+from .database import Database
+from .session_manager import (
+    BaseSessionManager, SessionManager, RedisSessionManager, SQLiteSessionManager, create_session_manager
+)
+from .chat_history import BaseChatHistoryService, ChatHistoryService, RedisChatHistoryService, SQLiteChatHistoryService
+from .appointment import BaseAppointmentService, AppointmentService, SQLiteAppointmentService
+from .slots import SlotService
+from .response_cache import ResponseCache, RedisResponseCache, create_response_cache
 from .ai_assistant import AIAssistantService
 
 __all__ = [
+    "Database",
+    "BaseSessionManager",
     "SessionManager",
-    "ChatHistoryService", 
+    "RedisSessionManager",
+    "SQLiteSessionManager",
+    "create_session_manager",
+    "BaseChatHistoryService",
+    "ChatHistoryService",
+    "RedisChatHistoryService",
+    "SQLiteChatHistoryService",
+    "BaseAppointmentService",
     "AppointmentService",
+    "SQLiteAppointmentService",
+    "SlotService",
+    "ResponseCache",
+    "RedisResponseCache",
+    "create_response_cache",
     "AIAssistantService"
 ] 
\ No newline at end of file
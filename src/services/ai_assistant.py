@@ -2,235 +2,627 @@
 AI Assistant service for medical appointment booking.
 """
 
-from typing import Dict, List, Optional
-import json
-import os
+from typing import AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple
+from functools import cached_property, lru_cache
+import asyncio
+import hashlib
+import re
 from datetime import datetime, timedelta
 
+import tiktoken
+
+from fastapi.concurrency import run_in_threadpool
 from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage
+from langchain.schema import BaseMessage, HumanMessage, SystemMessage
 from langchain.prompts import PromptTemplate
 from langchain.agents import initialize_agent, AgentType
 from langchain.tools import Tool
 
-from ..models import SessionData, BookingStep, MessageType
-from .session_manager import SessionManager
+from ..models import SessionData, PatientInfo, ChatMessage, BookingStep, MessageType
+from .session_manager import BaseSessionManager
+from .response_cache import ResponseCache
+from .database import Database
+from .slots import SlotService
+
+# Static part of the system prompt. It never contains session data so the
+# prompt prefix is identical on every request and can hit provider-side
+# prompt caching.
+STATIC_SYSTEM_PROMPT = """You are a professional medical appointment booking assistant.
+Your role is to help patients book medical appointments through a conversational interface.
+
+Available doctors:
+- Dr. Smith (General Medicine)
+- Dr. Johnson (Cardiology)
+- Dr. Brown (Dermatology)
+
+Guidelines:
+1. Be professional, empathetic, and helpful
+2. Collect information step by step
+3. Ask only one question at a time
+4. Validate information before proceeding
+5. Provide clear next steps
+6. If symptoms suggest urgency, recommend immediate medical attention"""
+
+SESSION_NOT_FOUND_RESPONSE = "I'm sorry, I couldn't find your session. Please start a new booking session."
+ERROR_RESPONSE = "I apologize, but I'm having trouble processing your request right now. Please try again."
+
+# Patterns used by _update_session_state
+_TOKEN_RE = re.compile(r'[a-z]+|\d+')
+_PHONE_RE = re.compile(r'[\d\-\(\)\+\s]{10,}')
+_NON_DIGIT_RE = re.compile(r'\D')
+
+# Keyword -> (route, value); one dict lookup per token of the message
+_TOKEN_ROUTER = {
+    **{word: ('greeting', None) for word in ('hello', 'hi', 'hey', 'good')},
+    **{word: ('confirm', None) for word in ('yes', 'confirm', 'book', 'schedule')},
+    'smith': ('doctor', 'dr_smith'),
+    'johnson': ('doctor', 'dr_johnson'),
+    'brown': ('doctor', 'dr_brown'),
+    **{hour: ('slot', hour.lstrip('0')) for hour in ('9', '09', '10', '11', '12', '13', '14', '15', '16')},
+}
+
+# Booking state machine: each handler gets (session, keyword routes, user
+# message), fills in patient info and returns the next step, or None to stay
+
+def _handle_greeting(session: SessionData, routes: Dict[str, Optional[str]], user_message: str) -> Optional[BookingStep]:
+    if 'greeting' in routes:
+        return BookingStep.NAME_COLLECTION
+    return None
+
+def _handle_name(session: SessionData, routes: Dict[str, Optional[str]], user_message: str) -> Optional[BookingStep]:
+    # Simple name extraction - in production, use NLP
+    potential_name = user_message.strip()
+    if not session.patient_info.name and potential_name:
+        if len(potential_name.split()) <= 3 and potential_name.replace(' ', '').isalpha():
+            session.patient_info.name = potential_name
+            return BookingStep.PHONE_COLLECTION
+    return None
+
+def _handle_phone(session: SessionData, routes: Dict[str, Optional[str]], user_message: str) -> Optional[BookingStep]:
+    phone_match = _PHONE_RE.search(user_message)
+    if phone_match and len(_NON_DIGIT_RE.sub('', phone_match.group())) >= 10:
+        session.patient_info.phone = phone_match.group().strip()
+        return BookingStep.SYMPTOMS_COLLECTION
+    return None
+
+def _handle_symptoms(session: SessionData, routes: Dict[str, Optional[str]], user_message: str) -> Optional[BookingStep]:
+    if not session.patient_info.symptoms:
+        session.patient_info.symptoms = user_message
+        return BookingStep.DOCTOR_PREFERENCE
+    return None
+
+def _handle_doctor(session: SessionData, routes: Dict[str, Optional[str]], user_message: str) -> Optional[BookingStep]:
+    if 'doctor' in routes:
+        session.patient_info.preferred_doctor = routes['doctor']
+        return BookingStep.SLOT_SELECTION
+    return None
+
+def _handle_slot(session: SessionData, routes: Dict[str, Optional[str]], user_message: str) -> Optional[BookingStep]:
+    if 'slot' in routes:
+        return BookingStep.CONFIRMATION
+    return None
+
+def _handle_confirmation(session: SessionData, routes: Dict[str, Optional[str]], user_message: str) -> Optional[BookingStep]:
+    if 'confirm' in routes:
+        return BookingStep.COMPLETED
+    return None
+
+_STEP_HANDLERS: Dict[BookingStep, Callable[[SessionData, Dict[str, Optional[str]], str], Optional[BookingStep]]] = {
+    BookingStep.GREETING: _handle_greeting,
+    BookingStep.NAME_COLLECTION: _handle_name,
+    BookingStep.PHONE_COLLECTION: _handle_phone,
+    BookingStep.SYMPTOMS_COLLECTION: _handle_symptoms,
+    BookingStep.DOCTOR_PREFERENCE: _handle_doctor,
+    BookingStep.SLOT_SELECTION: _handle_slot,
+    BookingStep.CONFIRMATION: _handle_confirmation,
+}
+
+class _StateSnapshot(NamedTuple):
+    """Session state a turn may change, kept to undo it if the model call fails."""
+    current_step: BookingStep
+    patient_info: PatientInfo
+
+def _snapshot_state(session: SessionData) -> _StateSnapshot:
+    return _StateSnapshot(session.current_step, session.patient_info.model_copy())
+
+def _restore_state(session: SessionData, snapshot: _StateSnapshot):
+    session.current_step = snapshot.current_step
+    session.patient_info = snapshot.patient_info
+
+@lru_cache(maxsize=1)
+def _get_token_encoding():
+    """Load the model tokenizer once; None if it is unavailable (e.g. offline)."""
+    try:
+        return tiktoken.encoding_for_model("gpt-4o-mini")
+    except Exception as e:
+        print(f"Error loading tokenizer, estimating token counts instead: {e}")
+        return None
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of a text, or estimate them at ~4 characters per token."""
+    encoding = _get_token_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+SESSION_PROMPT_TEMPLATE = """Current session information:
+- Current step: {current_step}
+- Patient name: {patient_name}
+- Patient phone: {patient_phone}
+- Symptoms: {symptoms}
+- Preferred doctor: {preferred_doctor}
+
+Current step instructions:
+{step_instructions}"""
+
+_STEP_INSTRUCTIONS = {
+    BookingStep.GREETING: "Greet the patient warmly and ask for their name.",
+    BookingStep.NAME_COLLECTION: "Collect the patient's full name and confirm it's correct.",
+    BookingStep.PHONE_COLLECTION: "Ask for the patient's phone number for appointment confirmation.",
+    BookingStep.SYMPTOMS_COLLECTION: "Ask about their symptoms or reason for the visit. Be empathetic.",
+    BookingStep.DOCTOR_PREFERENCE: "Based on symptoms, suggest appropriate doctors and ask for preference.",
+    BookingStep.SLOT_SELECTION: "Show available slots for the preferred doctor and ask them to choose.",
+    BookingStep.CONFIRMATION: "Confirm all appointment details and finalize the booking.",
+    BookingStep.COMPLETED: "Provide appointment confirmation and next steps."
+}
+DEFAULT_STEP_INSTRUCTIONS = "Continue with the booking process."
+
+def _fill_step_fields(step: BookingStep) -> str:
+    """Fill in the step-specific parts of the session prompt, keeping the patient placeholders."""
+    return SESSION_PROMPT_TEMPLATE.format(
+        current_step=step.value,
+        step_instructions=_STEP_INSTRUCTIONS.get(step, DEFAULT_STEP_INSTRUCTIONS),
+        patient_name="{patient_name}",
+        patient_phone="{patient_phone}",
+        symptoms="{symptoms}",
+        preferred_doctor="{preferred_doctor}"
+    )
+
+# Session prompt per step; only the patient fields are formatted per turn, so
+# no patient data is kept around after the turn
+_STEP_PROMPT_TEMPLATES = {step: _fill_step_fields(step) for step in BookingStep}
+
+# Steps whose replies do not depend on collected patient information and can
+# therefore be shared between sessions (on their first turn only)
+CACHEABLE_STEPS = frozenset({BookingStep.GREETING})
+
+# Replies for steps whose next question is fixed, keyed by the step the user
+# message moved the session to; these turns skip the model call
+_STATIC_REPLIES = {
+    BookingStep.NAME_COLLECTION: (
+        "Hello, and welcome! I'll help you book your medical appointment. "
+        "To get started, could you please tell me your full name?"
+    ),
+    BookingStep.PHONE_COLLECTION: (
+        "Thank you, {name}. What is the best phone number to reach you for appointment confirmation?"
+    ),
+    BookingStep.SYMPTOMS_COLLECTION: (
+        "Thanks, I've noted your phone number as {phone}. "
+        "What symptoms are you experiencing, or what is the reason for your visit?"
+    ),
+    BookingStep.SLOT_SELECTION: (
+        "{doctor_name} has the following appointment slots available:\n{slots}\n"
+        "Which one would you like?"
+    ),
+}
+
+class PreparedTurn(NamedTuple):
+    """A turn loaded and ready for batched processing."""
+    session: SessionData
+    user_chat_message: ChatMessage
+    cache_key: Optional[str]
+    ready_response: Optional[str]
+    llm_messages: Optional[List[BaseMessage]]
+    state_snapshot: _StateSnapshot
 
 class AIAssistantService:
     """AI Assistant service for handling conversational appointment booking."""
     
-    def __init__(self, openai_api_key: str, session_manager: SessionManager):
-        self.llm = ChatOpenAI(
+    # Input token budget per model call, and the part kept free for the reply
+    MAX_INPUT_TOKENS = 2048
+    REPLY_HEADROOM_TOKENS = 256
+    # Approximate per-message overhead of the chat format
+    MESSAGE_OVERHEAD_TOKENS = 4
+    
+    def __init__(
+        self,
+        openai_api_key: str,
+        session_manager: BaseSessionManager,
+        response_cache: Optional[ResponseCache] = None,
+        slot_service: Optional[SlotService] = None,
+        database_path: str = "data/medscheduler.sqlite3"
+    ):
+        self._api_key = openai_api_key
+        self.session_manager = session_manager
+        self.response_cache = response_cache
+        self._slot_service = slot_service
+        self._database_path = database_path
+    
+    # The model client and the slot database are created on first use, so
+    # workers and scripts that never reach them skip the setup cost
+    @cached_property
+    def llm(self) -> ChatOpenAI:
+        """Chat model client."""
+        return ChatOpenAI(
             model="gpt-4o-mini",
             temperature=0.7,
-            openai_api_key=openai_api_key
+            openai_api_key=self._api_key
         )
-        self.session_manager = session_manager
-        self.available_slots = self._load_available_slots()
-    
-    def _load_available_slots(self) -> Dict:
-        """Load available appointment slots."""
-        slots_file = "data/available_slots.json"
-        if os.path.exists(slots_file):
-            with open(slots_file, 'r') as f:
-                return json.load(f)
-        
-        # Default slots if file doesn't exist
-        default_slots = {
-            "dr_smith": {
-                "name": "Dr. Smith",
-                "specialty": "General Medicine",
-                "available_slots": [
-                    {"date": "2024-01-15", "time": "09:00", "available": True},
-                    {"date": "2024-01-15", "time": "10:00", "available": True},
-                    {"date": "2024-01-16", "time": "14:00", "available": True}
-                ]
-            },
-            "dr_johnson": {
-                "name": "Dr. Johnson", 
-                "specialty": "Cardiology",
-                "available_slots": [
-                    {"date": "2024-01-15", "time": "11:00", "available": True},
-                    {"date": "2024-01-16", "time": "15:00", "available": True}
-                ]
-            },
-            "dr_brown": {
-                "name": "Dr. Brown",
-                "specialty": "Dermatology", 
-                "available_slots": [
-                    {"date": "2024-01-15", "time": "13:00", "available": True},
-                    {"date": "2024-01-17", "time": "10:00", "available": True}
-                ]
-            }
-        }
+    
+    @cached_property
+    def slot_service(self) -> SlotService:
+        """Doctor and slot store (opened from database_path unless one was passed in)."""
+        return self._slot_service or SlotService(Database(self._database_path))
+    
+    def get_system_prompt(self, session: SessionData) -> str:
+        """Get the session-specific part of the system prompt.
         
-        # Save default slots
-        os.makedirs("data", exist_ok=True)
-        with open(slots_file, 'w') as f:
-            json.dump(default_slots, f, indent=2)
+        It is sent as a separate message after STATIC_SYSTEM_PROMPT so the
+        static prefix stays identical across turns and sessions.
+        """
+        patient_info = session.patient_info
+        return _STEP_PROMPT_TEMPLATES[session.current_step].format(
+            patient_name=patient_info.name or "Not provided",
+            patient_phone=patient_info.phone or "Not provided",
+            symptoms=patient_info.symptoms or "Not provided",
+            preferred_doctor=patient_info.preferred_doctor or "Not specified"
+        )
+    
+    def _get_step_instructions(self, step: BookingStep) -> str:
+        """Get specific instructions for each booking step."""
+        return _STEP_INSTRUCTIONS.get(step, DEFAULT_STEP_INSTRUCTIONS)
+    
+    def process_message(self, session_id: str, user_message: str, session: Optional[SessionData] = None) -> str:
+        """Process user message and generate appropriate response.
         
-        return default_slots
+        If the caller already loaded the session it can pass it in; it is
+        updated in place, so the caller does not need to reload it afterwards.
+        """
+        assistant_message = self.process_turn(session_id, user_message, session)
+        if assistant_message is None:
+            return SESSION_NOT_FOUND_RESPONSE
+        return assistant_message.content
     
-    def get_system_prompt(self, session: SessionData) -> str:
-        """Get system prompt based on current session state."""
-        base_prompt = """You are a professional medical appointment booking assistant. 
-        Your role is to help patients book medical appointments through a conversational interface.
-        
-        Current session information:
-        - Current step: {current_step}
-        - Patient name: {patient_name}
-        - Patient phone: {patient_phone}
-        - Symptoms: {symptoms}
-        - Preferred doctor: {preferred_doctor}
-        
-        Available doctors:
-        - Dr. Smith (General Medicine)
-        - Dr. Johnson (Cardiology)
-        - Dr. Brown (Dermatology)
-        
-        Guidelines:
-        1. Be professional, empathetic, and helpful
-        2. Collect information step by step
-        3. Ask only one question at a time
-        4. Validate information before proceeding
-        5. Provide clear next steps
-        6. If symptoms suggest urgency, recommend immediate medical attention
-        
-        Current step instructions:
-        {step_instructions}
+    def process_turn(
+        self,
+        session_id: str,
+        user_message: str,
+        session: Optional[SessionData] = None,
+        metadata: Optional[Dict] = None
+    ) -> Optional[ChatMessage]:
+        """Run one chat turn and persist it with a single flush.
+        
+        The user message, the assistant reply and the updated session are
+        written together by SessionManager.flush_turn. Returns the saved
+        assistant message, or None if the session does not exist.
         """
+        if session is None:
+            session = self.session_manager.get_session(session_id)
+        if not session:
+            return None
+        
+        user_chat_message = ChatMessage(
+            session_id=session_id,
+            message_type=MessageType.USER,
+            content=user_message,
+            metadata=metadata
+        )
+        assistant_response = self._generate_response(session, user_message)
+        return self._finalize_turn(session, user_chat_message, assistant_response)
+    
+    async def aprocess_turn(
+        self,
+        session_id: str,
+        user_message: str,
+        session: Optional[SessionData] = None,
+        metadata: Optional[Dict] = None
+    ) -> Optional[ChatMessage]:
+        """Async version of process_turn for use on the event loop.
         
-        step_instructions = self._get_step_instructions(session.current_step)
+        The model is called with llm.ainvoke and storage and cache access
+        run in worker threads, so one slow reply does not hold up other
+        requests. The turn is persisted before returning.
+        """
+        if session is None:
+            session = await run_in_threadpool(self.session_manager.get_session, session_id)
+        if not session:
+            return None
         
-        return base_prompt.format(
-            current_step=session.current_step.value,
-            patient_name=session.patient_info.name or "Not provided",
-            patient_phone=session.patient_info.phone or "Not provided", 
-            symptoms=session.patient_info.symptoms or "Not provided",
-            preferred_doctor=session.patient_info.preferred_doctor or "Not specified",
-            step_instructions=step_instructions
+        user_chat_message = ChatMessage(
+            session_id=session_id,
+            message_type=MessageType.USER,
+            content=user_message,
+            metadata=metadata
         )
+        
+        # Use a template or a cached reply when the step does not need the model
+        snapshot = _snapshot_state(session)
+        cache_key, assistant_response = await run_in_threadpool(self._get_ready_response, session, user_message)
+        if assistant_response is None:
+            try:
+                llm_messages = await run_in_threadpool(self._build_llm_messages, session, user_message)
+                response = await self.llm.ainvoke(llm_messages)
+                assistant_response = await run_in_threadpool(self._accept_response, response.content, cache_key)
+            except Exception as e:
+                print(f"Error generating AI response: {e}")
+                _restore_state(session, snapshot)
+                assistant_response = ERROR_RESPONSE
+        
+        return await run_in_threadpool(self._finalize_turn, session, user_chat_message, assistant_response)
     
-    def _get_step_instructions(self, step: BookingStep) -> str:
-        """Get specific instructions for each booking step."""
-        instructions = {
-            BookingStep.GREETING: "Greet the patient warmly and ask for their name.",
-            BookingStep.NAME_COLLECTION: "Collect the patient's full name and confirm it's correct.",
-            BookingStep.PHONE_COLLECTION: "Ask for the patient's phone number for appointment confirmation.",
-            BookingStep.SYMPTOMS_COLLECTION: "Ask about their symptoms or reason for the visit. Be empathetic.",
-            BookingStep.DOCTOR_PREFERENCE: "Based on symptoms, suggest appropriate doctors and ask for preference.",
-            BookingStep.SLOT_SELECTION: "Show available slots for the preferred doctor and ask them to choose.",
-            BookingStep.CONFIRMATION: "Confirm all appointment details and finalize the booking.",
-            BookingStep.COMPLETED: "Provide appointment confirmation and next steps."
-        }
-        return instructions.get(step, "Continue with the booking process.")
+    async def astream_turn(
+        self,
+        session_id: str,
+        user_message: str,
+        session: Optional[SessionData] = None,
+        metadata: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        """Async version of process_turn that yields the reply as it is generated.
+        
+        Model replies are streamed chunk by chunk with llm.astream; templated
+        and cached replies are yielded whole. The turn is persisted after the
+        last chunk, so the session is up to date once the iterator ends.
+        Yields nothing if the session does not exist.
+        """
+        if session is None:
+            session = await run_in_threadpool(self.session_manager.get_session, session_id)
+        if not session:
+            return
+        
+        user_chat_message = ChatMessage(
+            session_id=session_id,
+            message_type=MessageType.USER,
+            content=user_message,
+            metadata=metadata
+        )
+        
+        snapshot = _snapshot_state(session)
+        cache_key, assistant_response = await run_in_threadpool(self._get_ready_response, session, user_message)
+        if assistant_response is None:
+            chunks = []
+            try:
+                llm_messages = await run_in_threadpool(self._build_llm_messages, session, user_message)
+                async for chunk in self.llm.astream(llm_messages):
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                        yield chunk.content
+                assistant_response = await run_in_threadpool(self._accept_response, "".join(chunks), cache_key)
+            except Exception as e:
+                print(f"Error generating AI response: {e}")
+                _restore_state(session, snapshot)
+                # Keep what the client has already been sent
+                assistant_response = "".join(chunks)
+                if not assistant_response:
+                    assistant_response = ERROR_RESPONSE
+                    yield assistant_response
+        else:
+            yield assistant_response
+        
+        await run_in_threadpool(self._finalize_turn, session, user_chat_message, assistant_response)
+    
+    async def aprocess_messages(self, items: List[Tuple[str, str]], max_concurrency: int = 16) -> List[str]:
+        """Process many (session_id, message) pairs with batched LLM calls.
+        
+        Meant for offline work such as replaying transcripts or evaluation
+        runs. Each round sends at most one message per session through
+        llm.abatch; later messages of the same session go into the next
+        round so every turn sees the state left by the previous one.
+        Returns the replies in the order of ``items``.
+        """
+        replies: List[str] = [""] * len(items)
+        pending = list(enumerate(items))
+        
+        while pending:
+            round_items, deferred, seen = [], [], set()
+            for index, (session_id, user_message) in pending:
+                if session_id in seen:
+                    deferred.append((index, (session_id, user_message)))
+                else:
+                    seen.add(session_id)
+                    round_items.append((index, (session_id, user_message)))
+            
+            round_replies = await self._aprocess_round([item for _, item in round_items], max_concurrency)
+            for (index, _), reply in zip(round_items, round_replies):
+                replies[index] = reply
+            pending = deferred
+        
+        return replies
     
-    def process_message(self, session_id: str, user_message: str) -> str:
-        """Process user message and generate appropriate response."""
+    async def _aprocess_round(self, items: List[Tuple[str, str]], max_concurrency: int) -> List[str]:
+        """Process messages for distinct sessions with one llm.abatch call."""
+        prepared = await asyncio.gather(
+            *(run_in_threadpool(self._prepare_turn, session_id, user_message) for session_id, user_message in items)
+        )
+        replies = [SESSION_NOT_FOUND_RESPONSE if turn is None else turn.ready_response for turn in prepared]
+        
+        # Only turns without a templated or cached reply go to the model
+        llm_indexes = [i for i, turn in enumerate(prepared) if turn is not None and turn.ready_response is None]
+        if llm_indexes:
+            results = await self.llm.abatch(
+                [prepared[i].llm_messages for i in llm_indexes],
+                config={"max_concurrency": max_concurrency},
+                return_exceptions=True
+            )
+            for i, result in zip(llm_indexes, results):
+                turn = prepared[i]
+                if isinstance(result, Exception):
+                    print(f"Error generating AI response: {result}")
+                    _restore_state(turn.session, turn.state_snapshot)
+                    replies[i] = ERROR_RESPONSE
+                else:
+                    replies[i] = self._accept_response(result.content, turn.cache_key)
+        
+        await asyncio.gather(*(
+            run_in_threadpool(self._finalize_turn, turn.session, turn.user_chat_message, reply)
+            for turn, reply in zip(prepared, replies) if turn is not None
+        ))
+        return replies
+    
+    def _prepare_turn(self, session_id: str, user_message: str) -> Optional[PreparedTurn]:
+        """Load the session and prepare one turn for batched processing.
+        
+        The session state is updated right away, with a snapshot kept to undo
+        it if the model call fails; LLM messages are only built when there is
+        no templated or cached reply.
+        """
         session = self.session_manager.get_session(session_id)
         if not session:
-            return "I'm sorry, I couldn't find your session. Please start a new booking session."
+            return None
+        
+        user_chat_message = ChatMessage(session_id=session_id, message_type=MessageType.USER, content=user_message)
+        snapshot = _snapshot_state(session)
+        cache_key, ready_response = self._get_ready_response(session, user_message)
+        if ready_response is not None:
+            return PreparedTurn(session, user_chat_message, cache_key, ready_response, None, snapshot)
+        llm_messages = self._build_llm_messages(session, user_message)
+        return PreparedTurn(session, user_chat_message, cache_key, None, llm_messages, snapshot)
+    
+    def _finalize_turn(self, session: SessionData, user_chat_message: ChatMessage, assistant_response: str) -> ChatMessage:
+        """Persist a finished turn and return the saved assistant message."""
+        assistant_chat_message = ChatMessage(
+            session_id=session.session_id,
+            message_type=MessageType.ASSISTANT,
+            content=assistant_response
+        )
+        
+        self.session_manager.flush_turn(session, user_chat_message, assistant_chat_message)
+        return assistant_chat_message
+    
+    def _generate_response(self, session: SessionData, user_message: str) -> str:
+        """Update the session in memory and generate the assistant reply."""
+        # Use a template or a cached reply when the step does not need the model
+        snapshot = _snapshot_state(session)
+        cache_key, ready_response = self._get_ready_response(session, user_message)
+        if ready_response is not None:
+            return ready_response
         
+        # Generate response
+        try:
+            response = self.llm.invoke(self._build_llm_messages(session, user_message))
+            return self._accept_response(response.content, cache_key)
+            
+        except Exception as e:
+            print(f"Error generating AI response: {e}")
+            _restore_state(session, snapshot)
+            return ERROR_RESPONSE
+    
+    def _get_ready_response(self, session: SessionData, user_message: str) -> Tuple[Optional[str], Optional[str]]:
+        """Update the session from the user message and look for a reply that needs no model call.
+        
+        Returns (cache key, reply). The reply is a template when the message
+        moved the session to a step in _STATIC_REPLIES, otherwise a cached
+        reply if there is one; the cache key is set for cacheable steps.
+        Callers undo the state update with _restore_state when the model
+        call for the turn fails, so the user can simply try again.
+        """
+        previous_step = session.current_step
+        self._update_session_state(session, user_message)
+        
+        if session.current_step != previous_step and session.current_step in _STATIC_REPLIES:
+            static_reply = self._format_static_reply(session)
+            if static_reply is not None:
+                return None, static_reply
+        
+        # Reuse a cached reply for steps that do not depend on patient data
+        return self._lookup_cached_response(session, user_message)
+    
+    def _format_static_reply(self, session: SessionData) -> Optional[str]:
+        """Fill in the reply template for the session's step; None to let the model answer."""
+        patient_info = session.patient_info
+        doctor = self.slot_service.get_doctor(patient_info.preferred_doctor) if patient_info.preferred_doctor else None
+        fields = {
+            "name": patient_info.name,
+            "phone": patient_info.phone,
+            "doctor_name": doctor["name"] if doctor else "your doctor"
+        }
+        
+        if session.current_step == BookingStep.SLOT_SELECTION:
+            slots = self.get_available_slots_for_doctor(patient_info.preferred_doctor)
+            if not slots:
+                return None
+            fields["slots"] = "\n".join(f"- {slot['date']} at {slot['time']}" for slot in slots)
+        
+        return _STATIC_REPLIES[session.current_step].format(**fields)
+    
+    def _lookup_cached_response(self, session: SessionData, user_message: str) -> Tuple[Optional[str], Optional[str]]:
+        """Get (cache key, cached reply) for the turn; both are None if the turn is not cacheable.
+        
+        Only a session's first turn is cacheable: the key does not cover chat
+        history, which the model sees on later turns.
+        """
+        if self.response_cache is None or session.current_step not in CACHEABLE_STEPS:
+            return None, None
+        if self.session_manager.chat_history_service.count_session_messages(session.session_id):
+            return None, None
+        cache_key = self._get_response_cache_key(session.current_step, user_message)
+        return cache_key, self.response_cache.get(cache_key)
+    
+    def _build_llm_messages(self, session: SessionData, user_message: str) -> List[BaseMessage]:
+        """Build the conversation context sent to the model."""
         # Get recent chat history for context
-        recent_messages = self.session_manager.chat_history_service.get_recent_messages(session_id, limit=5)
+        recent_messages = self.session_manager.chat_history_service.get_recent_messages(session.session_id, limit=5)
         
-        # Build conversation context
-        messages = [SystemMessage(content=self.get_system_prompt(session))]
+        # Build conversation context: static prefix first, then session state
+        messages = [
+            SystemMessage(content=STATIC_SYSTEM_PROMPT),
+            SystemMessage(content=self.get_system_prompt(session))
+        ]
         
-        # Add recent conversation history
-        for msg in recent_messages:
+        # Add recent conversation history that fits in the token budget,
+        # dropping the oldest messages first
+        budget = self.MAX_INPUT_TOKENS - self.REPLY_HEADROOM_TOKENS - sum(
+            count_tokens(text) + self.MESSAGE_OVERHEAD_TOKENS
+            for text in (STATIC_SYSTEM_PROMPT, messages[1].content, user_message)
+        )
+        history = []
+        for msg in reversed(recent_messages):
             if msg.message_type == MessageType.USER:
-                messages.append(HumanMessage(content=msg.content))
+                history_message = HumanMessage(content=msg.content)
             elif msg.message_type == MessageType.ASSISTANT:
-                messages.append(SystemMessage(content=f"Assistant previously said: {msg.content}"))
+                history_message = SystemMessage(content=f"Assistant previously said: {msg.content}")
+            else:
+                continue
+            
+            budget -= count_tokens(history_message.content) + self.MESSAGE_OVERHEAD_TOKENS
+            if budget < 0:
+                break
+            history.append(history_message)
+        messages.extend(reversed(history))
         
         # Add current user message
         messages.append(HumanMessage(content=user_message))
+        return messages
+    
+    def _accept_response(self, assistant_response: str, cache_key: Optional[str]) -> str:
+        """Cache a fresh model reply if its step allows it."""
+        if cache_key is not None:
+            self.response_cache.set(cache_key, assistant_response)
+        return assistant_response
+    
+    def _get_response_cache_key(self, step: BookingStep, user_message: str) -> str:
+        """Build the response cache key from the step and normalized message."""
+        normalized = " ".join(user_message.lower().split())
+        return hashlib.blake2b(f"{step.value}:{normalized}".encode(), digest_size=16).hexdigest()
+    
+    def _update_session_state(self, session: SessionData, user_message: str):
+        """Update session state based on the user message (persisted by the caller)."""
+        # Route each keyword once: lowercase words and digit runs, first match per route wins
+        routes = {}
+        for token in _TOKEN_RE.findall(user_message.lower()):
+            route = _TOKEN_ROUTER.get(token)
+            if route is not None:
+                routes.setdefault(route[0], route[1])
         
-        # Generate response
-        try:
-            response = self.llm.invoke(messages)
-            assistant_response = response.content
-            
-            # Update session based on response and user input
-            self._update_session_state(session, user_message, assistant_response)
-            
-            return assistant_response
-            
-        except Exception as e:
-            print(f"Error generating AI response: {e}")
-            return "I apologize, but I'm having trouble processing your request right now. Please try again."
-    
-    def _update_session_state(self, session: SessionData, user_message: str, assistant_response: str):
-        """Update session state based on conversation."""
-        user_lower = user_message.lower()
-        
-        # Update patient info based on current step
-        if session.current_step == BookingStep.GREETING:
-            if any(word in user_lower for word in ['hello', 'hi', 'hey', 'good']):
-                session.current_step = BookingStep.NAME_COLLECTION
-        
-        elif session.current_step == BookingStep.NAME_COLLECTION:
-            # Extract name from user message (simple extraction)
-            if not session.patient_info.name and len(user_message.strip()) > 0:
-                # Simple name extraction - in production, use NLP
-                potential_name = user_message.strip()
-                if len(potential_name.split()) <= 3 and potential_name.replace(' ', '').isalpha():
-                    session.patient_info.name = potential_name
-                    session.current_step = BookingStep.PHONE_COLLECTION
-        
-        elif session.current_step == BookingStep.PHONE_COLLECTION:
-            # Extract phone number
-            import re
-            phone_pattern = r'[\d\-\(\)\+\s]+'
-            phone_match = re.search(phone_pattern, user_message)
-            if phone_match and len(re.sub(r'[^\d]', '', phone_match.group())) >= 10:
-                session.patient_info.phone = phone_match.group().strip()
-                session.current_step = BookingStep.SYMPTOMS_COLLECTION
-        
-        elif session.current_step == BookingStep.SYMPTOMS_COLLECTION:
-            if not session.patient_info.symptoms:
-                session.patient_info.symptoms = user_message
-                session.current_step = BookingStep.DOCTOR_PREFERENCE
-        
-        elif session.current_step == BookingStep.DOCTOR_PREFERENCE:
-            # Check if user mentioned a doctor
-            if 'smith' in user_lower:
-                session.patient_info.preferred_doctor = 'dr_smith'
-                session.current_step = BookingStep.SLOT_SELECTION
-            elif 'johnson' in user_lower:
-                session.patient_info.preferred_doctor = 'dr_johnson'
-                session.current_step = BookingStep.SLOT_SELECTION
-            elif 'brown' in user_lower:
-                session.patient_info.preferred_doctor = 'dr_brown'
-                session.current_step = BookingStep.SLOT_SELECTION
-        
-        elif session.current_step == BookingStep.SLOT_SELECTION:
-            # Check if user selected a time slot
-            if any(time in user_lower for time in ['9', '10', '11', '12', '13', '14', '15', '16']):
-                session.current_step = BookingStep.CONFIRMATION
-        
-        elif session.current_step == BookingStep.CONFIRMATION:
-            if any(word in user_lower for word in ['yes', 'confirm', 'book', 'schedule']):
-                session.current_step = BookingStep.COMPLETED
-        
-        # Save updated session
-        self.session_manager.update_session(session)
+        # Update patient info and move to the next step using the current step's handler
+        handler = _STEP_HANDLERS.get(session.current_step)
+        next_step = handler(session, routes, user_message) if handler else None
+        if next_step is not None:
+            session.current_step = next_step
     
     def get_available_slots_for_doctor(self, doctor_key: str) -> List[Dict]:
         """Get available slots for a specific doctor."""
-        if doctor_key in self.available_slots:
-            return [slot for slot in self.available_slots[doctor_key]["available_slots"] if slot["available"]]
-        return []
+        return self.slot_service.get_available_slots_for_doctor(doctor_key)
     
     def reserve_slot(self, doctor_key: str, date: str, time: str) -> bool:
         """Reserve a specific time slot."""
-        if doctor_key in self.available_slots:
-            for slot in self.available_slots[doctor_key]["available_slots"]:
-                if slot["date"] == date and slot["time"] == time and slot["available"]:
-                    slot["available"] = False
-                    # Save updated slots
-                    with open("data/available_slots.json", 'w') as f:
-                        json.dump(self.available_slots, f, indent=2)
-                    return True
-        return False 
\ No newline at end of file
+        return self.slot_service.reserve_slot(doctor_key, date, time)
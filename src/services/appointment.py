@@ -2,66 +2,122 @@
 Appointment management service.
 """
 
-from typing import Optional, Dict
-from datetime import datetime
-import json
+from typing import Dict, Iterator, Optional
+from abc import ABC, abstractmethod
+import orjson
 import os
 
-class AppointmentService:
-    """Service for managing appointments."""
-    
-    def __init__(self, storage_path: str = "data/appointments"):
-        self.storage_path = storage_path
-        self._ensure_storage_directory()
+from ..models.base import utc_now
+from .database import Database
+from .file_storage import FileStorage
+
+class BaseAppointmentService(ABC):
+    """Appointment logic shared by the storage backends.
     
-    def _ensure_storage_directory(self):
-        """Ensure storage directory exists."""
-        os.makedirs(self.storage_path, exist_ok=True)
+    Backends implement _save_appointment, get_appointment and
+    iter_appointments.
+    """
     
     def reserve_appointment(self, session_id: str, doctor_key: str, date: str, time: str) -> Optional[Dict]:
         """Reserve an appointment and link it to session."""
         # This would integrate with your existing appointment reservation logic
         # For now, return a mock appointment
+        now = utc_now()
         appointment = {
-            "appointment_id": f"APT{int(datetime.now().timestamp())}",
+            "appointment_id": f"APT{int(now.timestamp())}",
             "session_id": session_id,
             "doctor_key": doctor_key,
             "date": date,
             "time": time,
             "status": "confirmed",
-            "created_at": datetime.now().isoformat()
+            "created_at": now.isoformat()
         }
         
         # Save appointment
-        file_path = os.path.join(self.storage_path, f"{appointment['appointment_id']}.json")
         try:
-            with open(file_path, 'w') as f:
-                json.dump(appointment, f, indent=2, default=str)
+            self._save_appointment(appointment)
             return appointment
         except Exception as e:
             print(f"Error saving appointment: {e}")
             return None
     
+    @abstractmethod
+    def _save_appointment(self, appointment: Dict):
+        """Write an appointment to persistent storage."""
+    
+    @abstractmethod
+    def get_appointment(self, appointment_id: str) -> Optional[Dict]:
+        """Get appointment by ID."""
+    
+    @abstractmethod
+    def iter_appointments(self) -> Iterator[Dict]:
+        """Iterate over appointments, loading one at a time."""
+    
+    def get_all_appointments(self) -> list:
+        """Get all appointments."""
+        return list(self.iter_appointments())
+
+
+class AppointmentService(FileStorage, BaseAppointmentService):
+    """Service for managing appointments."""
+    
+    def __init__(self, storage_path: str = "data/appointments"):
+        super().__init__(storage_path)
+    
+    def _save_appointment(self, appointment: Dict):
+        """Write an appointment to persistent storage."""
+        self._atomic_write(self._get_file_path(appointment['appointment_id']), orjson.dumps(appointment))
+    
     def get_appointment(self, appointment_id: str) -> Optional[Dict]:
         """Get appointment by ID."""
-        file_path = os.path.join(self.storage_path, f"{appointment_id}.json")
+        file_path = self._get_file_path(appointment_id)
         try:
             if os.path.exists(file_path):
-                with open(file_path, 'r') as f:
-                    return json.load(f)
+                with open(file_path, 'rb') as f:
+                    return orjson.loads(f.read())
         except Exception as e:
             print(f"Error loading appointment: {e}")
         return None
     
-    def get_all_appointments(self) -> list:
-        """Get all appointments."""
-        appointments = []
+    def iter_appointments(self) -> Iterator[Dict]:
+        """Iterate over appointments, loading one at a time."""
+        try:
+            with os.scandir(self.storage_path) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.json'):
+                        with open(entry.path, 'rb') as f:
+                            yield orjson.loads(f.read())
+        except Exception as e:
+            print(f"Error loading appointments: {e}")
+
+
+class SQLiteAppointmentService(BaseAppointmentService):
+    """Appointment service that stores appointments as rows of the appointments table."""
+    
+    def __init__(self, database: Database):
+        self.database = database
+    
+    def _save_appointment(self, appointment: Dict):
+        """Insert or replace an appointment row."""
+        self.database.execute(
+            "INSERT OR REPLACE INTO appointments (appointment_id, session_id, data, created_at) VALUES (?, ?, ?, ?)",
+            (appointment["appointment_id"], appointment["session_id"], orjson.dumps(appointment).decode(), appointment["created_at"])
+        )
+    
+    def get_appointment(self, appointment_id: str) -> Optional[Dict]:
+        """Get appointment by ID."""
+        try:
+            rows = self.database.execute("SELECT data FROM appointments WHERE appointment_id = ?", (appointment_id,))
+            if rows:
+                return orjson.loads(rows[0][0])
+        except Exception as e:
+            print(f"Error loading appointment: {e}")
+        return None
+    
+    def iter_appointments(self) -> Iterator[Dict]:
+        """Iterate over appointments, fetching rows in batches."""
         try:
-            for filename in os.listdir(self.storage_path):
-                if filename.endswith('.json'):
-                    with open(os.path.join(self.storage_path, filename), 'r') as f:
-                        appointment = json.load(f)
-                        appointments.append(appointment)
+            for row in self.database.iter_rows("SELECT data FROM appointments ORDER BY created_at"):
+                yield orjson.loads(row[0])
         except Exception as e:
             print(f"Error loading appointments: {e}")
-        return appointments 
\ No newline at end of file
@@ -3,74 +3,286 @@ Chat history management service.
 """
 
 from typing import List
-import json
+from abc import ABC, abstractmethod
+from collections import deque
+from itertools import islice
+import orjson
 import os
 
+import redis
+
 from ..models import ChatMessage
+from .database import Database
+from .file_storage import FileStorage
+
+class BaseChatHistoryService(ABC):
+    """Chat history interface shared by the storage backends."""
+    
+    def save_message(self, message: ChatMessage) -> bool:
+        """Append a chat message to persistent storage."""
+        return self.save_messages([message])
+    
+    @abstractmethod
+    def save_messages(self, messages: List[ChatMessage]) -> bool:
+        """Append messages of one session to persistent storage."""
+    
+    @abstractmethod
+    def get_session_messages(self, session_id: str, since: int = 0) -> List[ChatMessage]:
+        """Get the messages of a session, skipping the first `since` of them."""
+    
+    @abstractmethod
+    def count_session_messages(self, session_id: str) -> int:
+        """Count the messages of a session."""
+    
+    @abstractmethod
+    def get_recent_messages(self, session_id: str, limit: int = 10) -> List[ChatMessage]:
+        """Get recent messages for context."""
+    
+    @abstractmethod
+    def delete_session_history(self, session_id: str) -> bool:
+        """Delete chat history for a session."""
+
 
-class ChatHistoryService:
+class ChatHistoryService(FileStorage, BaseChatHistoryService):
     """Professional service for managing chat history with persistence."""
     
     def __init__(self, storage_path: str = "data/chat_history"):
-        self.storage_path = storage_path
-        self._ensure_storage_directory()
-    
-    def _ensure_storage_directory(self):
-        """Ensure storage directory exists."""
-        os.makedirs(self.storage_path, exist_ok=True)
+        super().__init__(storage_path)
     
     def _get_session_file_path(self, session_id: str) -> str:
-        """Get file path for session chat history."""
-        return os.path.join(self.storage_path, f"{session_id}.json")
+        """Get file path for session chat history (JSON Lines, one message per line)."""
+        return self._get_file_path(session_id, ".jsonl")
     
-    def save_message(self, message: ChatMessage) -> bool:
-        """Save a chat message to persistent storage."""
+    def _get_legacy_file_path(self, session_id: str) -> str:
+        """Get file path for chat history stored in the older single JSON array format."""
+        return self._get_file_path(session_id)
+    
+    def _load_legacy_messages(self, session_id: str) -> List[ChatMessage]:
+        """Load messages from a legacy JSON array file, if there is one."""
+        legacy_path = self._get_legacy_file_path(session_id)
+        if not os.path.exists(legacy_path):
+            return []
+        
+        with open(legacy_path, 'rb') as f:
+            data = orjson.loads(f.read())
+        
+        return [ChatMessage(**msg) for msg in data]
+    
+    def _migrate_legacy_history(self, session_id: str):
+        """Rewrite a legacy JSON array history file as JSON Lines."""
+        messages = self._load_legacy_messages(session_id)
+        self._atomic_write(
+            self._get_session_file_path(session_id),
+            "".join(msg.model_dump_json() + "\n" for msg in messages).encode()
+        )
+        os.remove(self._get_legacy_file_path(session_id))
+    
+    def save_messages(self, messages: List[ChatMessage]) -> bool:
+        """Append messages of one session to persistent storage in a single write."""
+        if not messages:
+            return True
+        
         try:
-            file_path = self._get_session_file_path(message.session_id)
-            
-            # Load existing messages
-            messages = self.get_session_messages(message.session_id)
+            session_id = messages[0].session_id
+            file_path = self._get_session_file_path(session_id)
             
-            # Add new message
-            messages.append(message)
+            if not os.path.exists(file_path) and os.path.exists(self._get_legacy_file_path(session_id)):
+                self._migrate_legacy_history(session_id)
             
-            # Save to file
-            with open(file_path, 'w') as f:
-                json.dump([msg.dict() for msg in messages], f, indent=2, default=str)
+            with open(file_path, 'a') as f:
+                f.write("".join(msg.model_dump_json() + "\n" for msg in messages))
             
             return True
         except Exception as e:
-            print(f"Error saving message: {e}")
+            print(f"Error saving messages: {e}")
             return False
     
-    def get_session_messages(self, session_id: str) -> List[ChatMessage]:
-        """Get all messages for a session."""
+    def get_session_messages(self, session_id: str, since: int = 0) -> List[ChatMessage]:
+        """Get the messages of a session, skipping the first `since` of them."""
         try:
             file_path = self._get_session_file_path(session_id)
             
             if not os.path.exists(file_path):
-                return []
+                return self._load_legacy_messages(session_id)[since:]
             
+            # Skipped lines are not parsed
             with open(file_path, 'r') as f:
-                data = json.load(f)
-            
-            return [ChatMessage(**msg) for msg in data]
+                lines = islice((line for line in f if line.strip()), since, None)
+                return [ChatMessage.model_validate_json(line) for line in lines]
         except Exception as e:
             print(f"Error loading messages: {e}")
             return []
     
+    def count_session_messages(self, session_id: str) -> int:
+        """Count the messages of a session without parsing them."""
+        try:
+            file_path = self._get_session_file_path(session_id)
+            
+            if not os.path.exists(file_path):
+                return len(self._load_legacy_messages(session_id))
+            
+            with open(file_path, 'r') as f:
+                return sum(1 for line in f if line.strip())
+        except Exception as e:
+            print(f"Error counting messages: {e}")
+            return 0
+    
     def get_recent_messages(self, session_id: str, limit: int = 10) -> List[ChatMessage]:
         """Get recent messages for context."""
-        messages = self.get_session_messages(session_id)
-        return messages[-limit:] if messages else []
+        try:
+            file_path = self._get_session_file_path(session_id)
+            
+            if not os.path.exists(file_path):
+                return self._load_legacy_messages(session_id)[-limit:]
+            
+            # Only the last `limit` lines are kept while reading
+            with open(file_path, 'r') as f:
+                lines = deque((line for line in f if line.strip()), maxlen=limit)
+            
+            return [ChatMessage.model_validate_json(line) for line in lines]
+        except Exception as e:
+            print(f"Error loading messages: {e}")
+            return []
     
     def delete_session_history(self, session_id: str) -> bool:
         """Delete chat history for a session."""
         try:
-            file_path = self._get_session_file_path(session_id)
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            for file_path in (self._get_session_file_path(session_id), self._get_legacy_file_path(session_id)):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            return True
+        except Exception as e:
+            print(f"Error deleting session history: {e}")
+            return False
+
+
+class RedisChatHistoryService(BaseChatHistoryService):
+    """Chat history service that stores each session's messages as a Redis list."""
+    
+    KEY_PREFIX = "chat:"
+    
+    def __init__(self, client: redis.Redis, ttl_seconds: int = 24 * 3600):
+        self.redis = client
+        self.ttl_seconds = ttl_seconds
+    
+    def _get_session_key(self, session_id: str) -> str:
+        """Get Redis key for session chat history."""
+        return f"{self.KEY_PREFIX}{session_id}"
+    
+    def save_messages(self, messages: List[ChatMessage]) -> bool:
+        """Append messages of one session to its history list in one round trip."""
+        if not messages:
+            return True
+        
+        try:
+            key = self._get_session_key(messages[0].session_id)
+            pipe = self.redis.pipeline()
+            pipe.rpush(key, *(msg.model_dump_json() for msg in messages))
+            pipe.expire(key, self.ttl_seconds)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"Error saving messages: {e}")
+            return False
+    
+    def get_session_messages(self, session_id: str, since: int = 0) -> List[ChatMessage]:
+        """Get the messages of a session, skipping the first `since` of them."""
+        try:
+            data = self.redis.lrange(self._get_session_key(session_id), since, -1)
+            return [ChatMessage.model_validate_json(msg) for msg in data]
+        except Exception as e:
+            print(f"Error loading messages: {e}")
+            return []
+    
+    def count_session_messages(self, session_id: str) -> int:
+        """Count the messages of a session."""
+        try:
+            return self.redis.llen(self._get_session_key(session_id))
+        except Exception as e:
+            print(f"Error counting messages: {e}")
+            return 0
+    
+    def get_recent_messages(self, session_id: str, limit: int = 10) -> List[ChatMessage]:
+        """Get recent messages for context without reading the whole list."""
+        try:
+            data = self.redis.lrange(self._get_session_key(session_id), -limit, -1)
+            return [ChatMessage.model_validate_json(msg) for msg in data]
+        except Exception as e:
+            print(f"Error loading messages: {e}")
+            return []
+    
+    def delete_session_history(self, session_id: str) -> bool:
+        """Delete chat history for a session."""
+        try:
+            self.redis.delete(self._get_session_key(session_id))
+            return True
+        except Exception as e:
+            print(f"Error deleting session history: {e}")
+            return False
+
+
+class SQLiteChatHistoryService(BaseChatHistoryService):
+    """Chat history service that stores messages as rows of the chat_messages table."""
+    
+    def __init__(self, database: Database):
+        self.database = database
+    
+    def save_messages(self, messages: List[ChatMessage]) -> bool:
+        """Insert messages of one session in a single transaction."""
+        try:
+            with self.database.transaction() as conn:
+                self._insert_messages(conn, messages)
+            return True
+        except Exception as e:
+            print(f"Error saving messages: {e}")
+            return False
+    
+    def _insert_messages(self, conn, messages: List[ChatMessage]):
+        """Insert messages using an open transaction."""
+        conn.executemany(
+            "INSERT INTO chat_messages (message_id, session_id, timestamp, message_type, data) VALUES (?, ?, ?, ?, ?)",
+            [
+                (msg.id, msg.session_id, msg.timestamp.timestamp(), msg.message_type.value, msg.model_dump_json())
+                for msg in messages
+            ]
+        )
+    
+    def get_session_messages(self, session_id: str, since: int = 0) -> List[ChatMessage]:
+        """Get the messages of a session, skipping the first `since` of them."""
+        try:
+            rows = self.database.execute(
+                "SELECT data FROM chat_messages WHERE session_id = ? ORDER BY seq LIMIT -1 OFFSET ?", (session_id, since)
+            )
+            return [ChatMessage.model_validate_json(row[0]) for row in rows]
+        except Exception as e:
+            print(f"Error loading messages: {e}")
+            return []
+    
+    def count_session_messages(self, session_id: str) -> int:
+        """Count the messages of a session."""
+        try:
+            rows = self.database.execute("SELECT COUNT(*) FROM chat_messages WHERE session_id = ?", (session_id,))
+            return rows[0][0]
+        except Exception as e:
+            print(f"Error counting messages: {e}")
+            return 0
+    
+    def get_recent_messages(self, session_id: str, limit: int = 10) -> List[ChatMessage]:
+        """Get recent messages for context without reading the whole history."""
+        try:
+            rows = self.database.execute(
+                "SELECT data FROM chat_messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?", (session_id, limit)
+            )
+            return [ChatMessage.model_validate_json(row[0]) for row in reversed(rows)]
+        except Exception as e:
+            print(f"Error loading messages: {e}")
+            return []
+    
+    def delete_session_history(self, session_id: str) -> bool:
+        """Delete chat history for a session."""
+        try:
+            self.database.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
             return True
         except Exception as e:
             print(f"Error deleting session history: {e}")
-            return False 
\ No newline at end of file
+            return False
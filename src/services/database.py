@@ -0,0 +1,76 @@
+"""
+SQLite database shared by the SQLite-backed services.
+"""
+
+from contextlib import contextmanager
+from typing import Iterator, List, Sequence
+import os
+import sqlite3
+import threading
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sessions ("
+    "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL, status TEXT NOT NULL, updated_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions (status)",
+    "CREATE TABLE IF NOT EXISTS chat_messages ("
+    "seq INTEGER PRIMARY KEY AUTOINCREMENT, message_id TEXT NOT NULL, session_id TEXT NOT NULL, "
+    "timestamp REAL NOT NULL, message_type TEXT NOT NULL, data TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id ON chat_messages (session_id, seq)",
+    "CREATE TABLE IF NOT EXISTS appointments ("
+    "appointment_id TEXT PRIMARY KEY, session_id TEXT, data TEXT NOT NULL, created_at TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_appointments_session_id ON appointments (session_id)",
+    "CREATE TABLE IF NOT EXISTS doctors (doctor_key TEXT PRIMARY KEY, name TEXT NOT NULL, specialty TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS slots ("
+    "doctor_key TEXT NOT NULL, date TEXT NOT NULL, time TEXT NOT NULL, available INTEGER NOT NULL, "
+    "PRIMARY KEY (doctor_key, date, time))",
+    "CREATE INDEX IF NOT EXISTS idx_slots_doctor_available ON slots (doctor_key, available)",
+)
+
+class Database:
+    """Thread-safe SQLite connection in WAL mode.
+
+    One connection is shared by the services of a worker process; WAL lets
+    other worker processes read while one of them writes.
+    """
+
+    def __init__(self, db_path: str = "data/medscheduler.sqlite3"):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+
+    def execute(self, query: str, params: Sequence = ()) -> List[tuple]:
+        """Run a single statement and return all result rows."""
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def iter_rows(self, query: str, params: Sequence = (), batch_size: int = 100) -> Iterator[tuple]:
+        """Yield the rows of a query, fetching them in batches."""
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run several statements atomically in one transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
@@ -0,0 +1,39 @@
+"""
+Shared base for services that keep one file per entity.
+"""
+
+import os
+import tempfile
+
+class FileStorage:
+    """Base class for file-backed services.
+
+    Creates the storage directory once on construction and builds entity
+    file paths from a precomputed directory prefix.
+    """
+
+    def __init__(self, storage_path: str):
+        self.storage_path = storage_path
+        os.makedirs(storage_path, exist_ok=True)
+        # Built once so file paths are a single string concatenation
+        self._path_prefix = os.path.join(storage_path, "")
+
+    def _get_file_path(self, key: str, extension: str = ".json") -> str:
+        """Get the file path for an entity key."""
+        return f"{self._path_prefix}{key}{extension}"
+
+    def _atomic_write(self, file_path: str, data: bytes):
+        """Replace a file's contents atomically.
+
+        Data goes to a temporary file in the same directory which is then
+        renamed over the target, so readers see the old or the new file,
+        never a partial one.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.storage_path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
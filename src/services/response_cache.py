@@ -0,0 +1,75 @@
+"""
+Cache for AI assistant responses that do not depend on patient data.
+"""
+
+from typing import Optional, Tuple
+from collections import OrderedDict
+import threading
+import time
+
+import redis
+
+from ..config import Settings
+
+class ResponseCache:
+    """In-process response cache with a TTL and a bounded number of entries."""
+    
+    def __init__(self, ttl_seconds: int = 3600, max_entries: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Get a cached response, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            
+            expires_at, value = entry
+            if time.monotonic() > expires_at:
+                del self._entries[key]
+                return None
+            return value
+    
+    def set(self, key: str, value: str) -> None:
+        """Cache a response."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class RedisResponseCache(ResponseCache):
+    """Response cache shared between worker processes through Redis."""
+    
+    KEY_PREFIX = "aicache:"
+    
+    def __init__(self, client: redis.Redis, ttl_seconds: int = 3600):
+        self.redis = client
+        self.ttl_seconds = ttl_seconds
+    
+    def get(self, key: str) -> Optional[str]:
+        """Get a cached response, or None if missing or expired."""
+        try:
+            return self.redis.get(f"{self.KEY_PREFIX}{key}")
+        except Exception as e:
+            print(f"Error reading response cache: {e}")
+            return None
+    
+    def set(self, key: str, value: str) -> None:
+        """Cache a response."""
+        try:
+            self.redis.set(f"{self.KEY_PREFIX}{key}", value, ex=self.ttl_seconds)
+        except Exception as e:
+            print(f"Error writing response cache: {e}")
+
+def create_response_cache(settings: Settings) -> ResponseCache:
+    """Create the response cache for the configured storage backend."""
+    if settings.storage_backend == "redis":
+        return RedisResponseCache(
+            redis.Redis.from_url(settings.redis_url, decode_responses=True),
+            ttl_seconds=settings.response_cache_ttl_seconds
+        )
+    return ResponseCache(ttl_seconds=settings.response_cache_ttl_seconds)
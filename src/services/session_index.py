@@ -0,0 +1,83 @@
+"""
+SQLite index of session status and expiry for the file-backed session store.
+"""
+
+from typing import List, Optional
+from datetime import datetime
+import sqlite3
+import threading
+
+from ..models import SessionStatus
+
+class SessionIndex:
+    """Lightweight index of ``(session_id, expires_at, status)`` rows.
+    
+    Lets cleanup and status-filtered listing find matching sessions without
+    opening and parsing every session file.
+    """
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, expires_at REAL, status TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions (status)")
+    
+    def is_empty(self) -> bool:
+        """Check whether the index has no rows."""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone() is None
+    
+    def upsert(self, session_id: str, expires_at: Optional[datetime], status: SessionStatus):
+        """Insert or update the index row for a session."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, expires_at, status) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET expires_at = excluded.expires_at, status = excluded.status",
+                (session_id, expires_at.timestamp() if expires_at else None, status.value)
+            )
+    
+    def remove(self, session_id: str):
+        """Remove the index row for a session."""
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+    
+    def session_ids(self, status_filter: Optional[SessionStatus] = None, now: Optional[datetime] = None) -> List[str]:
+        """Get IDs of sessions that may match the status filter.
+        
+        Sessions past ``expires_at`` count as expired even if their stored
+        status has not been updated yet.
+        """
+        if status_filter is None:
+            query, params = "SELECT session_id FROM sessions", ()
+        elif status_filter == SessionStatus.EXPIRED:
+            query = "SELECT session_id FROM sessions WHERE status = ? OR expires_at < ?"
+            params = (SessionStatus.EXPIRED.value, now.timestamp())
+        else:
+            query, params = "SELECT session_id FROM sessions WHERE status = ?", (status_filter.value,)
+        
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params)]
+    
+    def count(self, status_filter: Optional[SessionStatus] = None, now: Optional[datetime] = None) -> int:
+        """Count sessions matching the status filter.
+        
+        Sessions past ``expires_at`` count as expired, not under their stored status.
+        """
+        if status_filter is None:
+            query, params = "SELECT COUNT(*) FROM sessions", ()
+        elif status_filter == SessionStatus.EXPIRED:
+            query = "SELECT COUNT(*) FROM sessions WHERE status = ? OR expires_at < ?"
+            params = (SessionStatus.EXPIRED.value, now.timestamp())
+        else:
+            query = "SELECT COUNT(*) FROM sessions WHERE status = ? AND (expires_at IS NULL OR expires_at >= ?)"
+            params = (status_filter.value, now.timestamp())
+        
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
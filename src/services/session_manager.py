@@ -2,37 +2,59 @@
 Session management service.
 """
 
-from typing import Dict, List, Optional
-from datetime import datetime, timedelta
-import json
+from typing import Dict, Iterator, List, Optional, Tuple
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import timedelta
 import os
+import threading
 
+import redis
+
+from ..config import Settings
 from ..models import (
-    SessionData, MessageType, SessionStatus, BookingStep, ChatHistoryResponse
+    SessionData, ChatMessage, MessageType, SessionStatus, BookingStep, ChatHistoryResponse
+)
+from ..models.base import utc_now
+from .chat_history import (
+    BaseChatHistoryService, ChatHistoryService, RedisChatHistoryService, SQLiteChatHistoryService
 )
-from .chat_history import ChatHistoryService
+from .database import Database
+from .file_storage import FileStorage
+from .session_index import SessionIndex
 
-class SessionManager:
-    """Professional session management service."""
+class BaseSessionManager(ABC):
+    """Professional session management service.
     
-    def __init__(self, storage_path: str = "data/sessions", session_timeout_hours: int = 24):
-        self.storage_path = storage_path
+    Holds the storage-independent session logic. Storage backends implement
+    _load_session, _save_session, _list_session_ids and delete_session, and
+    pass their chat history service to __init__.
+    """
+    
+    def __init__(self, chat_history_service: BaseChatHistoryService, session_timeout_hours: int = 24):
+        self.chat_history_service = chat_history_service
         self.session_timeout_hours = session_timeout_hours
-        self.chat_history_service = ChatHistoryService()
-        self._ensure_storage_directory()
     
-    def _ensure_storage_directory(self):
-        """Ensure storage directory exists."""
-        os.makedirs(self.storage_path, exist_ok=True)
+    @abstractmethod
+    def _load_session(self, session_id: str) -> Optional[SessionData]:
+        """Load session data from storage, or None if there is no such session."""
     
-    def _get_session_file_path(self, session_id: str) -> str:
-        """Get file path for session data."""
-        return os.path.join(self.storage_path, f"{session_id}.json")
+    @abstractmethod
+    def _save_session(self, session: SessionData) -> bool:
+        """Save session to persistent storage."""
+    
+    @abstractmethod
+    def _list_session_ids(self, status_filter: Optional[SessionStatus] = None) -> List[str]:
+        """List the IDs of stored sessions that may match the status filter."""
+    
+    @abstractmethod
+    def delete_session(self, session_id: str) -> bool:
+        """Delete a session and its chat history."""
     
     def create_session(self, patient_email: Optional[str] = None, metadata: Optional[Dict] = None) -> SessionData:
         """Create a new session with professional structure."""
         session = SessionData(
-            expires_at=datetime.now() + timedelta(hours=self.session_timeout_hours),
+            expires_at=utc_now() + timedelta(hours=self.session_timeout_hours),
             metadata=metadata or {}
         )
         
@@ -47,80 +69,80 @@ class SessionManager:
     def get_session(self, session_id: str) -> Optional[SessionData]:
         """Get session data with expiration check."""
         try:
-            file_path = self._get_session_file_path(session_id)
-            
-            if not os.path.exists(file_path):
+            session = self._load_session(session_id)
+            if not session:
                 return None
             
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-            
-            session = SessionData(**data)
-            
-            # Check if session is expired
-            if session.expires_at and datetime.now() > session.expires_at:
-                session.status = SessionStatus.EXPIRED
-                self._save_session(session)
-            
+            self._expire_if_needed(session)
             return session
         except Exception as e:
             print(f"Error loading session: {e}")
             return None
     
+    def _expire_if_needed(self, session: SessionData):
+        """Mark a session as expired once it is past its expiry time."""
+        if session.status != SessionStatus.EXPIRED and session.expires_at and utc_now() > session.expires_at:
+            session.status = SessionStatus.EXPIRED
+            self._save_session(session)
+    
     def update_session(self, session: SessionData) -> bool:
         """Update session data."""
         try:
-            session.updated_at = datetime.now()
+            session.updated_at = utc_now()
             return self._save_session(session)
         except Exception as e:
             print(f"Error updating session: {e}")
             return False
     
-    def _save_session(self, session: SessionData) -> bool:
-        """Save session to persistent storage."""
-        try:
-            file_path = self._get_session_file_path(session.session_id)
-            
-            with open(file_path, 'w') as f:
-                json.dump(session.dict(), f, indent=2, default=str)
-            
-            return True
-        except Exception as e:
-            print(f"Error saving session: {e}")
-            return False
-    
     def update_patient_info(self, session_id: str, field: str, value: str) -> bool:
         """Update specific patient information field."""
-        session = self.get_session(session_id)
-        if not session:
-            return False
-        
-        # Update the field
-        setattr(session.patient_info, field, value)
-        
-        return self.update_session(session)
+        return self.update_session_fields(session_id, **{field: value})
     
     def update_booking_step(self, session_id: str, step: BookingStep) -> bool:
         """Update the current booking step."""
+        return self.update_session_fields(session_id, current_step=step)
+    
+    def update_session_fields(self, session_id: str, current_step: Optional[BookingStep] = None, **patient_fields) -> bool:
+        """Apply several updates to a session with one load and one write.
+        
+        The fields are applied to a freshly loaded copy of the session, which
+        is then saved once, so e.g. name, phone and step set together cost a
+        single write.
+        """
         session = self.get_session(session_id)
         if not session:
             return False
         
-        session.current_step = step
+        for field, value in patient_fields.items():
+            setattr(session.patient_info, field, value)
+        if current_step is not None:
+            session.current_step = current_step
+        
         return self.update_session(session)
     
-    def get_chat_history(self, session_id: str) -> Optional[ChatHistoryResponse]:
-        """Get complete chat history for a session."""
+    def get_chat_history(self, session_id: str, since: int = 0, limit: Optional[int] = None) -> Optional[ChatHistoryResponse]:
+        """Get chat history for a session.
+        
+        With `since`, only messages after the first `since` are returned;
+        with `limit`, only the last `limit` of those. total_messages is the
+        number of stored messages, including the skipped ones.
+        """
         session = self.get_session(session_id)
         if not session:
             return None
         
-        messages = self.chat_history_service.get_session_messages(session_id)
+        stored = self.chat_history_service.count_session_messages(session_id)
+        start = min(since, stored)
+        if limit is not None:
+            start = max(start, stored - limit)
+        
+        # Counted from what was read, so messages saved after the count are included
+        messages = self.chat_history_service.get_session_messages(session_id, start)
         
         return ChatHistoryResponse(
             session_id=session_id,
             messages=messages,
-            total_messages=len(messages),
+            total_messages=start + len(messages),
             patient_info=session.patient_info,
             current_step=session.current_step,
             session_status=session.status,
@@ -130,8 +152,6 @@ class SessionManager:
     
     def save_chat_message(self, session_id: str, message_type: MessageType, content: str, metadata: Optional[Dict] = None):
         """Save a chat message."""
-        from ..models import ChatMessage
-        
         message = ChatMessage(
             session_id=session_id,
             message_type=message_type,
@@ -143,37 +163,405 @@ class SessionManager:
             return message
         return None
     
+    def flush_turn(self, session: SessionData, user_message: ChatMessage, assistant_message: ChatMessage) -> bool:
+        """Persist a whole chat turn: both messages in one append, then the session once."""
+        messages_saved = self.chat_history_service.save_messages([user_message, assistant_message])
+        return self.update_session(session) and messages_saved
+    
     def cleanup_expired_sessions(self) -> int:
         """Clean up expired sessions."""
         cleaned_count = 0
         try:
-            for filename in os.listdir(self.storage_path):
-                if filename.endswith('.json'):
-                    session_id = filename[:-5]  # Remove .json extension
-                    session = self.get_session(session_id)
-                    
-                    if session and session.status == SessionStatus.EXPIRED:
-                        # Delete session and chat history
-                        os.remove(self._get_session_file_path(session_id))
-                        self.chat_history_service.delete_session_history(session_id)
+            for session_id in self._list_session_ids(SessionStatus.EXPIRED):
+                session = self.get_session(session_id)
+                
+                if session and session.status == SessionStatus.EXPIRED:
+                    # Delete session and chat history
+                    if self.delete_session(session_id):
                         cleaned_count += 1
         except Exception as e:
             print(f"Error during cleanup: {e}")
         
         return cleaned_count
     
-    def get_all_sessions(self, status_filter: Optional[SessionStatus] = None) -> List[SessionData]:
-        """Get all sessions with optional status filter."""
-        sessions = []
+    def iter_sessions(self, status_filter: Optional[SessionStatus] = None) -> Iterator[SessionData]:
+        """Iterate over sessions with optional status filter, loading one at a time."""
         try:
-            for filename in os.listdir(self.storage_path):
-                if filename.endswith('.json'):
-                    session_id = filename[:-5]
-                    session = self.get_session(session_id)
-                    
-                    if session and (not status_filter or session.status == status_filter):
-                        sessions.append(session)
+            session_ids = self._list_session_ids(status_filter)
         except Exception as e:
             print(f"Error loading sessions: {e}")
+            return
         
-        return sessions 
\ No newline at end of file
+        for session_id in session_ids:
+            session = self.get_session(session_id)
+            
+            if session and (not status_filter or session.status == status_filter):
+                yield session
+    
+    @abstractmethod
+    def count_sessions(self, status_filter: Optional[SessionStatus] = None) -> int:
+        """Count sessions matching the status filter without loading them."""
+
+
+class SessionManager(FileStorage, BaseSessionManager):
+    """Session manager that keeps each session in a JSON file.
+    
+    Loaded sessions are cached in memory and a SQLite index of expiry and
+    status serves listing and cleanup.
+    """
+    
+    # Maximum number of sessions kept in the in-memory cache
+    SESSION_CACHE_SIZE = 1024
+    
+    def __init__(self, storage_path: str = "data/sessions", session_timeout_hours: int = 24):
+        FileStorage.__init__(self, storage_path)
+        BaseSessionManager.__init__(self, ChatHistoryService(), session_timeout_hours)
+        # session_id -> (file signature, session); the signature (inode, mtime,
+        # size) detects writes made by other worker processes. Every save
+        # replaces the file, so the inode changes even when mtime and size do not.
+        # Cached sessions always match the file: callers get copies, and only
+        # loads and saves replace an entry
+        self._session_cache: "OrderedDict[str, Tuple[Tuple[int, int, int], SessionData]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.index = SessionIndex(self._get_file_path("_index", ".sqlite"))
+        if self.index.is_empty():
+            self._rebuild_index()
+    
+    def _get_session_file_path(self, session_id: str) -> str:
+        """Get file path for session data."""
+        return self._get_file_path(session_id)
+    
+    def _get_file_signature(self, file_path: str) -> Tuple[int, int, int]:
+        """Get the (inode, mtime, size) signature used to validate cached sessions."""
+        stat = os.stat(file_path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    
+    def _cache_session(self, session: SessionData, signature: Tuple[int, int, int]):
+        """Store a session in the in-memory cache."""
+        with self._cache_lock:
+            self._session_cache[session.session_id] = (signature, session)
+            self._session_cache.move_to_end(session.session_id)
+            while len(self._session_cache) > self.SESSION_CACHE_SIZE:
+                self._session_cache.popitem(last=False)
+    
+    def _evict_cached_session(self, session_id: str):
+        """Remove a session from the in-memory cache."""
+        with self._cache_lock:
+            self._session_cache.pop(session_id, None)
+    
+    def _load_session(self, session_id: str) -> Optional[SessionData]:
+        """Load session data, from the cache when the file has not changed.
+        
+        Returns a copy, so changes are not visible to other callers until saved.
+        """
+        file_path = self._get_session_file_path(session_id)
+        
+        try:
+            signature = self._get_file_signature(file_path)
+        except FileNotFoundError:
+            self._evict_cached_session(session_id)
+            return None
+        
+        with self._cache_lock:
+            cached = self._session_cache.get(session_id)
+            if cached and cached[0] == signature:
+                self._session_cache.move_to_end(session_id)
+                return cached[1].model_copy(deep=True)
+        
+        # Validate straight from the raw bytes in pydantic-core, without
+        # building an intermediate dict
+        with open(file_path, 'rb') as f:
+            session = SessionData.model_validate_json(f.read())
+        
+        self._cache_session(session.model_copy(deep=True), signature)
+        return session
+    
+    def _rebuild_index(self):
+        """Index session files that were written before the index existed."""
+        with os.scandir(self.storage_path) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json'):
+                    try:
+                        session = self._load_session(entry.name[:-5])
+                        self.index.upsert(session.session_id, session.expires_at, session.status)
+                    except Exception as e:
+                        print(f"Error indexing session {entry.name}: {e}")
+    
+    def _list_session_ids(self, status_filter: Optional[SessionStatus] = None) -> List[str]:
+        """List the IDs of stored sessions that may match the status filter."""
+        return self.index.session_ids(status_filter, now=utc_now())
+    
+    def count_sessions(self, status_filter: Optional[SessionStatus] = None) -> int:
+        """Count sessions matching the status filter using the index."""
+        try:
+            return self.index.count(status_filter, now=utc_now())
+        except Exception as e:
+            print(f"Error counting sessions: {e}")
+            return 0
+    
+    def _save_session(self, session: SessionData) -> bool:
+        """Save session to persistent storage."""
+        try:
+            file_path = self._get_session_file_path(session.session_id)
+            
+            self._atomic_write(file_path, session.model_dump_json().encode())
+            
+            self._cache_session(session.model_copy(deep=True), self._get_file_signature(file_path))
+            self.index.upsert(session.session_id, session.expires_at, session.status)
+            return True
+        except Exception as e:
+            print(f"Error saving session: {e}")
+            # The write may or may not have landed; drop the cached copy so
+            # the next load reads the file
+            self._evict_cached_session(session.session_id)
+            return False
+    
+    def delete_session(self, session_id: str) -> bool:
+        """Delete a session and its chat history."""
+        try:
+            self.chat_history_service.delete_session_history(session_id)
+            
+            self._evict_cached_session(session_id)
+            self.index.remove(session_id)
+            
+            file_path = self._get_session_file_path(session_id)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            return True
+        except Exception as e:
+            print(f"Error deleting session: {e}")
+            return False
+
+
+class RedisSessionManager(BaseSessionManager):
+    """Session manager that keeps sessions and chat history in Redis.
+    
+    Sessions are stored as JSON strings under ``session:{id}`` with a TTL of
+    ``session_timeout_hours``, so every worker process shares the same state.
+    ``session_status:{id}`` holds the status and expiry timestamp with the
+    same TTL, so sessions can be counted without decoding them.
+    """
+    
+    KEY_PREFIX = "session:"
+    STATUS_KEY_PREFIX = "session_status:"
+    # Number of status keys fetched per MGET when counting
+    COUNT_BATCH_SIZE = 500
+    
+    def __init__(self, redis_url: str = "redis://localhost:6379/0", session_timeout_hours: int = 24):
+        self.session_ttl_seconds = session_timeout_hours * 3600
+        self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+        super().__init__(RedisChatHistoryService(self.redis, ttl_seconds=self.session_ttl_seconds), session_timeout_hours)
+    
+    def _get_session_key(self, session_id: str) -> str:
+        """Get Redis key for session data."""
+        return f"{self.KEY_PREFIX}{session_id}"
+    
+    def _get_status_key(self, session_id: str) -> str:
+        """Get Redis key for the session's status and expiry."""
+        return f"{self.STATUS_KEY_PREFIX}{session_id}"
+    
+    def _load_session(self, session_id: str) -> Optional[SessionData]:
+        """Load session data from Redis."""
+        data = self.redis.get(self._get_session_key(session_id))
+        if data is None:
+            return None
+        return SessionData.model_validate_json(data)
+    
+    def _list_session_ids(self, status_filter: Optional[SessionStatus] = None) -> List[str]:
+        """List the IDs of all sessions stored in Redis (the status is checked by the caller)."""
+        prefix_length = len(self.KEY_PREFIX)
+        return [key[prefix_length:] for key in self.redis.scan_iter(match=f"{self.KEY_PREFIX}*")]
+    
+    def _save_session(self, session: SessionData) -> bool:
+        """Save session to Redis, refreshing its TTL."""
+        try:
+            expires_at = session.expires_at.timestamp() if session.expires_at else ""
+            pipe = self.redis.pipeline()
+            pipe.set(
+                self._get_session_key(session.session_id),
+                session.model_dump_json(),
+                ex=self.session_ttl_seconds
+            )
+            pipe.set(
+                self._get_status_key(session.session_id),
+                f"{session.status.value} {expires_at}",
+                ex=self.session_ttl_seconds
+            )
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"Error saving session: {e}")
+            return False
+    
+    def delete_session(self, session_id: str) -> bool:
+        """Delete a session and its chat history."""
+        try:
+            self.redis.delete(
+                self._get_session_key(session_id),
+                self._get_status_key(session_id),
+                self.chat_history_service._get_session_key(session_id)
+            )
+            return True
+        except Exception as e:
+            print(f"Error deleting session: {e}")
+            return False
+    
+    def count_sessions(self, status_filter: Optional[SessionStatus] = None) -> int:
+        """Count sessions matching the status filter from their keys and status keys.
+        
+        Sessions past expires_at count as expired, not under their stored status.
+        """
+        try:
+            if status_filter is None:
+                return sum(1 for _ in self.redis.scan_iter(match=f"{self.KEY_PREFIX}*", count=self.COUNT_BATCH_SIZE))
+            
+            now = utc_now().timestamp()
+            count = 0
+            keys = list(self.redis.scan_iter(match=f"{self.STATUS_KEY_PREFIX}*", count=self.COUNT_BATCH_SIZE))
+            for start in range(0, len(keys), self.COUNT_BATCH_SIZE):
+                for value in self.redis.mget(keys[start:start + self.COUNT_BATCH_SIZE]):
+                    if value is None:
+                        continue
+                    status, expires_at = value.split(" ")
+                    if expires_at and float(expires_at) < now:
+                        status = SessionStatus.EXPIRED.value
+                    if status == status_filter.value:
+                        count += 1
+            return count
+        except Exception as e:
+            print(f"Error counting sessions: {e}")
+            return 0
+
+
+class SQLiteSessionManager(BaseSessionManager):
+    """Session manager that keeps sessions and chat history in one SQLite database.
+    
+    Listing and cleanup are single queries on the indexed status and expiry
+    columns, and a chat turn is saved in one transaction.
+    """
+    
+    def __init__(self, database: Database, session_timeout_hours: int = 24):
+        self.database = database
+        super().__init__(SQLiteChatHistoryService(database), session_timeout_hours)
+    
+    def _load_session(self, session_id: str) -> Optional[SessionData]:
+        """Load session data from the database."""
+        rows = self.database.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,))
+        if not rows:
+            return None
+        return SessionData.model_validate_json(rows[0][0])
+    
+    def _list_session_ids(self, status_filter: Optional[SessionStatus] = None) -> List[str]:
+        """List the IDs of stored sessions that may match the status filter."""
+        where, params = self._status_condition(status_filter)
+        return [row[0] for row in self.database.execute(f"SELECT session_id FROM sessions{where}", params)]
+    
+    def _status_condition(self, status_filter: Optional[SessionStatus]) -> Tuple[str, tuple]:
+        """Build the WHERE clause for a status filter; sessions past expires_at count as expired."""
+        if status_filter is None:
+            return "", ()
+        if status_filter == SessionStatus.EXPIRED:
+            return " WHERE status = ? OR expires_at < ?", (SessionStatus.EXPIRED.value, utc_now().timestamp())
+        return " WHERE status = ?", (status_filter.value,)
+    
+    def count_sessions(self, status_filter: Optional[SessionStatus] = None) -> int:
+        """Count sessions matching the status filter."""
+        where, params = self._status_condition(status_filter)
+        if status_filter and status_filter != SessionStatus.EXPIRED:
+            # Sessions past expires_at are counted as expired, not under their stored status
+            where += " AND (expires_at IS NULL OR expires_at >= ?)"
+            params += (utc_now().timestamp(),)
+        try:
+            return self.database.execute(f"SELECT COUNT(*) FROM sessions{where}", params)[0][0]
+        except Exception as e:
+            print(f"Error counting sessions: {e}")
+            return 0
+    
+    def _save_session(self, session: SessionData) -> bool:
+        """Save session to the database."""
+        try:
+            with self.database.transaction() as conn:
+                self._upsert_session(conn, session)
+            return True
+        except Exception as e:
+            print(f"Error saving session: {e}")
+            return False
+    
+    def _upsert_session(self, conn, session: SessionData):
+        """Insert or replace a session row using an open transaction."""
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, data, expires_at, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (
+                session.session_id,
+                session.model_dump_json(),
+                session.expires_at.timestamp() if session.expires_at else None,
+                session.status.value,
+                session.updated_at.timestamp()
+            )
+        )
+    
+    def delete_session(self, session_id: str) -> bool:
+        """Delete a session and its chat history."""
+        try:
+            with self.database.transaction() as conn:
+                conn.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
+                conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            return True
+        except Exception as e:
+            print(f"Error deleting session: {e}")
+            return False
+    
+    def flush_turn(self, session: SessionData, user_message: ChatMessage, assistant_message: ChatMessage) -> bool:
+        """Persist both messages and the session in a single transaction."""
+        try:
+            session.updated_at = utc_now()
+            with self.database.transaction() as conn:
+                self.chat_history_service._insert_messages(conn, [user_message, assistant_message])
+                self._upsert_session(conn, session)
+            return True
+        except Exception as e:
+            print(f"Error saving chat turn: {e}")
+            return False
+    
+    def cleanup_expired_sessions(self) -> int:
+        """Delete expired sessions and their chat history with one statement each."""
+        try:
+            where, params = self._status_condition(SessionStatus.EXPIRED)
+            with self.database.transaction() as conn:
+                conn.execute(f"DELETE FROM chat_messages WHERE session_id IN (SELECT session_id FROM sessions{where})", params)
+                return conn.execute(f"DELETE FROM sessions{where}", params).rowcount
+        except Exception as e:
+            print(f"Error during cleanup: {e}")
+            return 0
+    
+    def iter_sessions(self, status_filter: Optional[SessionStatus] = None) -> Iterator[SessionData]:
+        """Iterate over sessions with optional status filter, fetching rows in batches."""
+        where, params = self._status_condition(status_filter)
+        try:
+            # Ordered by key so rows rewritten during the scan are not visited again
+            for row in self.database.iter_rows(f"SELECT data FROM sessions{where} ORDER BY session_id", params):
+                session = SessionData.model_validate_json(row[0])
+                self._expire_if_needed(session)
+                
+                if not status_filter or session.status == status_filter:
+                    yield session
+        except Exception as e:
+            print(f"Error loading sessions: {e}")
+
+
+def create_session_manager(settings: Settings) -> BaseSessionManager:
+    """Create the session manager for the configured storage backend."""
+    if settings.storage_backend == "redis":
+        return RedisSessionManager(
+            redis_url=settings.redis_url,
+            session_timeout_hours=settings.session_timeout_hours
+        )
+    if settings.storage_backend == "sqlite":
+        return SQLiteSessionManager(
+            Database(settings.database_path),
+            session_timeout_hours=settings.session_timeout_hours
+        )
+    return SessionManager(
+        storage_path=settings.sessions_directory,
+        session_timeout_hours=settings.session_timeout_hours
+    )
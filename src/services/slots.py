@@ -0,0 +1,95 @@
+"""
+Appointment slot service.
+"""
+
+from typing import Dict, List, Optional
+import orjson
+import os
+
+from .database import Database
+
+# Slots used when there is no slots file to import
+DEFAULT_SLOTS = {
+    "dr_smith": {
+        "name": "Dr. Smith",
+        "specialty": "General Medicine",
+        "available_slots": [
+            {"date": "2024-01-15", "time": "09:00", "available": True},
+            {"date": "2024-01-15", "time": "10:00", "available": True},
+            {"date": "2024-01-16", "time": "14:00", "available": True}
+        ]
+    },
+    "dr_johnson": {
+        "name": "Dr. Johnson",
+        "specialty": "Cardiology",
+        "available_slots": [
+            {"date": "2024-01-15", "time": "11:00", "available": True},
+            {"date": "2024-01-16", "time": "15:00", "available": True}
+        ]
+    },
+    "dr_brown": {
+        "name": "Dr. Brown",
+        "specialty": "Dermatology",
+        "available_slots": [
+            {"date": "2024-01-15", "time": "13:00", "available": True},
+            {"date": "2024-01-17", "time": "10:00", "available": True}
+        ]
+    }
+}
+
+class SlotService:
+    """Doctors and their appointment slots, one database row per slot.
+
+    Reserving a slot is a single conditional UPDATE, so two concurrent
+    reservations of the same slot cannot both succeed.
+    """
+
+    def __init__(self, database: Database, seed_file: str = "data/available_slots.json"):
+        self.database = database
+        if not self.database.execute("SELECT 1 FROM doctors LIMIT 1"):
+            self._import_slots(seed_file)
+
+    def _import_slots(self, seed_file: str):
+        """Fill empty tables from the slots JSON file, or from DEFAULT_SLOTS."""
+        slots = DEFAULT_SLOTS
+        if os.path.exists(seed_file):
+            with open(seed_file, 'rb') as f:
+                slots = orjson.loads(f.read())
+
+        with self.database.transaction() as conn:
+            for doctor_key, doctor in slots.items():
+                conn.execute(
+                    "INSERT OR IGNORE INTO doctors (doctor_key, name, specialty) VALUES (?, ?, ?)",
+                    (doctor_key, doctor["name"], doctor["specialty"])
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO slots (doctor_key, date, time, available) VALUES (?, ?, ?, ?)",
+                    [(doctor_key, slot["date"], slot["time"], int(slot["available"])) for slot in doctor["available_slots"]]
+                )
+
+    def get_doctor(self, doctor_key: str) -> Optional[Dict]:
+        """Get a doctor's name and specialty."""
+        rows = self.database.execute("SELECT name, specialty FROM doctors WHERE doctor_key = ?", (doctor_key,))
+        if not rows:
+            return None
+        return {"name": rows[0][0], "specialty": rows[0][1]}
+
+    def get_available_slots_for_doctor(self, doctor_key: str) -> List[Dict]:
+        """Get available slots for a specific doctor."""
+        rows = self.database.execute(
+            "SELECT date, time FROM slots WHERE doctor_key = ? AND available = 1 ORDER BY date, time", (doctor_key,)
+        )
+        return [{"date": date, "time": time, "available": True} for date, time in rows]
+
+    def reserve_slot(self, doctor_key: str, date: str, time: str) -> bool:
+        """Reserve a specific time slot if it is still available."""
+        try:
+            with self.database.transaction() as conn:
+                cursor = conn.execute(
+                    "UPDATE slots SET available = 0 WHERE doctor_key = ? AND date = ? AND time = ? AND available = 1",
+                    (doctor_key, date, time)
+                )
+                return cursor.rowcount == 1
+        except Exception as e:
+            print(f"Error reserving slot: {e}")
+            return False
@@ -5,10 +5,15 @@ Streamlit frontend for the Medical Appointment Booking System.
 
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
-from datetime import datetime, timedelta
-import uuid
+import os
+import re
 import time
+from collections import namedtuple
+from datetime import datetime
+from dotenv import load_dotenv
 
 # Configure Streamlit page
 st.set_page_config(
@@ -19,92 +24,171 @@ st.set_page_config(
 )
 
 # API Configuration
-import os
-from dotenv import load_dotenv
-load_dotenv()
+@st.cache_resource
+def load_api_port():
+    """Load .env once per process and return the API port."""
+    load_dotenv()
+    return os.getenv("PORT", "8000")
 
-API_PORT = os.getenv("PORT", "8000")
+API_PORT = load_api_port()
 API_BASE_URL = f"http://localhost:{API_PORT}"
 
 # Custom CSS for better styling
-st.markdown("""
-<style>
-    .main-header {
-        text-align: center;
-        color: #2E86AB;
-        font-size: 3rem;
-        font-weight: bold;
-        margin-bottom: 2rem;
-    }
-    .chat-message {
-        padding: 1rem;
-        border-radius: 10px;
-        margin: 0.5rem 0;
-    }
-    .user-message {
-        background-color: #E3F2FD;
-        margin-left: 2rem;
-    }
-    .assistant-message {
-        background-color: #F1F8E9;
-        margin-right: 2rem;
-    }
-    .session-info {
-        background-color: #FFF3E0;
-        padding: 1rem;
-        border-radius: 10px;
-        border-left: 4px solid #FF9800;
-    }
-    .success-message {
-        background-color: #E8F5E8;
-        padding: 1rem;
-        border-radius: 10px;
-        border-left: 4px solid #4CAF50;
-    }
-    .error-message {
-        background-color: #FFEBEE;
-        padding: 1rem;
-        border-radius: 10px;
-        border-left: 4px solid #F44336;
-    }
-</style>
-""", unsafe_allow_html=True)
+STYLESHEET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "streamlit.css")
+
+# (connect, read) timeout for backend calls, so the spinner never hangs forever
+REQUEST_TIMEOUT = (3, 30)
+
+# Column width ratios of the page layouts
+WELCOME_COLUMNS = (1, 2, 1)
+CHAT_COLUMNS = (2, 1)
+PATIENT_INFO_COLUMNS = (1, 1)
+PAGER_COLUMNS = (1, 1)
+
+# Number of sessions per page in the sessions table
+SESSIONS_PAGE_SIZE = 20
+
+# Patient info shown in each column, as (label, key) pairs
+PATIENT_INFO_FIELDS = (
+    (("Name", "name"), ("Phone", "phone"), ("Email", "email")),
+    (("Symptoms", "symptoms"), ("Preferred Doctor", "preferred_doctor"), ("Preferred Date", "preferred_date"))
+)
+
+# Booking progress labels and the index of each booking step
+BOOKING_STEPS = (
+    "Greeting",
+    "Name Collection",
+    "Phone Collection",
+    "Symptoms Collection",
+    "Doctor Preference",
+    "Slot Selection",
+    "Confirmation",
+    "Completed"
+)
+STEP_INDEX = {
+    "greeting": 0,
+    "name_collection": 1,
+    "phone_collection": 2,
+    "symptoms_collection": 3,
+    "doctor_preference": 4,
+    "slot_selection": 5,
+    "confirmation": 6,
+    "completed": 7
+}
+
+# Initial session state; mutable values are given as factories so each
+# Streamlit session gets its own
+SESSION_STATE_DEFAULTS = {
+    'session_id': None,
+    'chat_history': list,
+    'last_turn': 0,
+    'patient_info': dict,
+    'current_step': "greeting",
+    'show_sessions': False,
+    'sessions_offset': 0,
+    'recent_booking_session': None
+}
+
+# Seconds during which starting again with the same email reuses the session
+# just created in this browser session
+SESSION_REUSE_SECONDS = 30
+
+# Number of most recent turns kept for display
+MAX_DISPLAY_TURNS = 50
+
+# Message types shown in the chat
+DISPLAYED_MESSAGE_TYPES = ("user", "assistant")
+
+# One rendered chat turn; kept as a tuple so reruns don't rebuild dicts
+ChatTurn = namedtuple("ChatTurn", "type content timestamp")
+
+# Avatar shown next to each chat turn
+CHAT_AVATARS = {
+    "user": None,
+    "assistant": "🏥"
+}
+
+@st.cache_resource
+def load_stylesheet():
+    """Read and minify the custom CSS once per process."""
+    with open(STYLESHEET_PATH, 'r') as f:
+        css = re.sub(r"\s*([{}:;,])\s*", r"\1", re.sub(r"\s+", " ", f.read())).strip()
+    return f"<style>{css}</style>"
+
+@st.cache_resource
+def get_http_session():
+    """Get the pooled HTTP session for backend calls.
+    
+    Streamlit re-executes this script on every rerun, so the session is
+    kept as a cached resource; one connection pool is then shared by all
+    reruns and all users of the app process.
+    """
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=64,
+        max_retries=Retry(total=2, backoff_factor=0.1)
+    ))
+    # Responses over 1 KB come back gzip-compressed from the backend's GZipMiddleware
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Accept-Encoding": "gzip",
+        "Connection": "keep-alive"
+    })
+    return session
 
 def initialize_session_state():
     """Initialize Streamlit session state variables."""
-    if 'session_id' not in st.session_state:
-        st.session_state.session_id = None
-    if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = []
-    if 'patient_info' not in st.session_state:
-        st.session_state.patient_info = {}
-    if 'current_step' not in st.session_state:
-        st.session_state.current_step = "greeting"
+    for key, default in SESSION_STATE_DEFAULTS.items():
+        st.session_state.setdefault(key, default() if callable(default) else default)
+
+def request_booking_session(patient_email):
+    """Create a booking session via API.
+    
+    Double clicks and reruns during the request reuse the session this
+    browser session created for the same email in the last
+    SESSION_REUSE_SECONDS instead of creating another one. The record is
+    kept in st.session_state, so other users never share it. Failures
+    raise, so they are not recorded.
+    """
+    recent = st.session_state.recent_booking_session
+    if recent and recent[0] == patient_email and time.monotonic() - recent[1] < SESSION_REUSE_SECONDS:
+        return recent[2]
+    
+    response = get_http_session().post(
+        f"{API_BASE_URL}/sessions",
+        json={"patient_email": patient_email},
+        timeout=REQUEST_TIMEOUT
+    )
+    response.raise_for_status()
+    session_data = response.json()
+    st.session_state.recent_booking_session = (patient_email, time.monotonic(), session_data)
+    return session_data
 
 def create_booking_session(patient_email):
     """Create a new booking session via API."""
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/sessions",
-            json={"patient_email": patient_email},
-            headers={"Content-Type": "application/json"}
-        )
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Failed to create session: {response.text}")
-            return None
+        return request_booking_session(patient_email)
+    except requests.exceptions.HTTPError as e:
+        st.error(f"Failed to create session: {e.response.text}")
+        return None
     except requests.exceptions.RequestException as e:
         st.error(f"Connection error: {e}")
         return None
 
-def send_chat_message(session_id, message):
-    """Send a chat message via API."""
+def send_chat_message(session_id, message, stream=False):
+    """Send a chat message via API.
+    
+    With stream=True this returns an iterator over the reply text chunks
+    as the backend generates them, instead of the whole response.
+    """
+    if stream:
+        return stream_chat_message(session_id, message)
     try:
-        response = requests.post(
+        response = get_http_session().post(
             f"{API_BASE_URL}/chat",
             json={"session_id": session_id, "message": message},
-            headers={"Content-Type": "application/json"}
+            timeout=REQUEST_TIMEOUT
         )
         if response.status_code == 200:
             return response.json()
@@ -115,10 +199,37 @@ def send_chat_message(session_id, message):
         st.error(f"Connection error: {e}")
         return None
 
-def get_chat_history(session_id):
-    """Get chat history via API."""
+def stream_chat_message(session_id, message):
+    """Send a chat message via the streaming API and yield the reply text as it arrives."""
     try:
-        response = requests.get(f"{API_BASE_URL}/chat-history/{session_id}")
+        with get_http_session().post(
+            f"{API_BASE_URL}/chat/stream",
+            json={"session_id": session_id, "message": message},
+            stream=True,
+            timeout=REQUEST_TIMEOUT
+        ) as response:
+            if response.status_code != 200:
+                st.error(f"Failed to send message: {response.text}")
+                return
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("data: "):
+                    event = json.loads(line[6:])
+                    if "token" in event:
+                        yield event["token"]
+                    elif "error" in event:
+                        st.error(event["error"])
+    except requests.exceptions.RequestException as e:
+        st.error(f"Connection error: {e}")
+
+@st.cache_data(ttl=5, show_spinner=False)
+def get_chat_history(session_id, since=0):
+    """Get chat history after the first `since` messages via API, memoized for a few seconds across reruns."""
+    try:
+        response = get_http_session().get(
+            f"{API_BASE_URL}/chat-history/{session_id}",
+            params={"since": since},
+            timeout=REQUEST_TIMEOUT
+        )
         if response.status_code == 200:
             return response.json()
         else:
@@ -126,53 +237,172 @@ def get_chat_history(session_id):
     except requests.exceptions.RequestException as e:
         return None
 
-def display_chat_message(message_type, content, timestamp=None):
-    """Display a chat message with proper styling."""
-    if message_type == "user":
-        st.markdown(f"""
-        <div class="chat-message user-message">
-            <strong>You:</strong> {content}
-            {f'<small style="color: #666;">{timestamp}</small>' if timestamp else ''}
-        </div>
-        """, unsafe_allow_html=True)
-    else:
-        st.markdown(f"""
-        <div class="chat-message assistant-message">
-            <strong>🏥 MediBook Assistant:</strong> {content}
-            {f'<small style="color: #666;">{timestamp}</small>' if timestamp else ''}
-        </div>
-        """, unsafe_allow_html=True)
+@st.cache_data(ttl=10, show_spinner=False)
+def list_sessions(offset=0, limit=SESSIONS_PAGE_SIZE):
+    """Get one page of sessions via API, memoized for a few seconds across reruns."""
+    response = get_http_session().get(
+        f"{API_BASE_URL}/sessions",
+        params={"limit": limit, "offset": offset},
+        timeout=REQUEST_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()
+
+def sync_chat_history():
+    """Append the messages the backend has stored since the last sync.
+    
+    The backend owns the full history; only the newest MAX_DISPLAY_TURNS
+    turns are kept here for display.
+    """
+    history = get_chat_history(st.session_state.session_id, st.session_state.last_turn)
+    if not history:
+        return
+    
+    chat_history = st.session_state.chat_history
+    for message in history['messages']:
+        if message['message_type'] in DISPLAYED_MESSAGE_TYPES:
+            timestamp = datetime.fromisoformat(message['timestamp']).astimezone().strftime("%H:%M:%S")
+            chat_history.append(ChatTurn(message['message_type'], message['content'], timestamp))
+    del chat_history[:-MAX_DISPLAY_TURNS]
+    
+    st.session_state.last_turn = history['total_messages']
+    st.session_state.current_step = history['current_step']
+    st.session_state.patient_info = history['patient_info']
+
+def display_chat_history(chat_history):
+    """Display chat turns with Streamlit's chat message elements."""
+    for turn in chat_history:
+        with st.chat_message(turn.type, avatar=CHAT_AVATARS.get(turn.type)):
+            st.markdown(turn.content)
+            if turn.timestamp:
+                st.caption(turn.timestamp)
 
 def display_patient_info(patient_info):
     """Display current patient information."""
     if patient_info:
         st.markdown("### 📋 Current Information")
-        col1, col2 = st.columns(2)
+        col1, col2 = st.columns(PATIENT_INFO_COLUMNS)
         
-        with col1:
-            if patient_info.get('name'):
-                st.write(f"**Name:** {patient_info['name']}")
-            if patient_info.get('phone'):
-                st.write(f"**Phone:** {patient_info['phone']}")
-            if patient_info.get('email'):
-                st.write(f"**Email:** {patient_info['email']}")
+        # One markdown element per column
+        for column, fields in zip((col1, col2), PATIENT_INFO_FIELDS):
+            with column:
+                st.markdown("\n\n".join(
+                    f"**{label}:** {patient_info[key]}" for label, key in fields if patient_info.get(key)
+                ))
+
+@st.fragment
+def chat_panel():
+    """Chat and booking panels; sending a message reruns only this fragment."""
+    sync_chat_history()
+    
+    # Chat interface
+    col1, col2 = st.columns(CHAT_COLUMNS)
+    
+    with col1:
+        st.header("💬 Chat with MediBook Assistant")
         
-        with col2:
-            if patient_info.get('symptoms'):
-                st.write(f"**Symptoms:** {patient_info['symptoms']}")
-            if patient_info.get('preferred_doctor'):
-                st.write(f"**Preferred Doctor:** {patient_info['preferred_doctor']}")
-            if patient_info.get('preferred_date'):
-                st.write(f"**Preferred Date:** {patient_info['preferred_date']}")
+        # Chat history
+        chat_container = st.container()
+        with chat_container:
+            display_chat_history(st.session_state.chat_history)
+        
+        # Chat input
+        if user_input := st.chat_input("Hi, I'd like to book an appointment"):
+            # Show the reply below the history as it streams in
+            with chat_container:
+                with st.chat_message("user", avatar=CHAT_AVATARS["user"]):
+                    st.markdown(user_input)
+                with st.chat_message("assistant", avatar=CHAT_AVATARS["assistant"]):
+                    st.write_stream(send_chat_message(st.session_state.session_id, user_input, stream=True))
+            
+            # The backend history changed, drop memoized reads and pick up the turn
+            get_chat_history.clear()
+            previous_step = st.session_state.current_step
+            sync_chat_history()
+            
+            # The sidebar shows the booking step, so only a step change reruns the whole app
+            if st.session_state.current_step != previous_step:
+                st.rerun()
+    
+    with col2:
+        # Patient information panel
+        display_patient_info(st.session_state.patient_info)
+        
+        st.divider()
+        
+        # Available doctors info
+        st.markdown("### 👨‍⚕️ Available Doctors")
+        doctors_info = """
+        **Dr. Smith** - General Medicine  
+        **Dr. Johnson** - Cardiology  
+        **Dr. Brown** - Dermatology  
+        """
+        st.markdown(doctors_info)
+        
+        st.divider()
+        
+        # Booking progress
+        st.markdown("### 📊 Booking Progress")
+        current_step_index = STEP_INDEX.get(st.session_state.current_step, 0)
+        st.markdown("\n\n".join(
+            f"{'✅' if i <= current_step_index else '⏳'} {step}" for i, step in enumerate(BOOKING_STEPS)
+        ))
+
+def display_sessions_page():
+    """Display one page of sessions as a table with previous/next buttons."""
+    offset = st.session_state.sessions_offset
+    try:
+        sessions = list_sessions(offset)['sessions']
+    except:
+        st.error("Failed to fetch sessions")
+        return
+    
+    st.dataframe(sessions, height=300, hide_index=True)
+    
+    col_prev, col_next = st.columns(PAGER_COLUMNS)
+    with col_prev:
+        if st.button("◀ Previous", disabled=offset == 0):
+            st.session_state.sessions_offset = max(offset - SESSIONS_PAGE_SIZE, 0)
+            st.rerun()
+    with col_next:
+        # A short page is the last one
+        if st.button("Next ▶", disabled=len(sessions) < SESSIONS_PAGE_SIZE):
+            st.session_state.sessions_offset = offset + SESSIONS_PAGE_SIZE
+            st.rerun()
 
 def main():
     """Main Streamlit application."""
     initialize_session_state()
     
+    # Streamlit keeps only the elements emitted in each run, so the styles are re-emitted every time
+    st.markdown(load_stylesheet(), unsafe_allow_html=True)
+    
     # Header
     st.markdown('<h1 class="main-header">🏥 MediBook</h1>', unsafe_allow_html=True)
     st.markdown('<p style="text-align: center; font-size: 1.2rem; color: #666;">AI-Powered Medical Appointment Booking</p>', unsafe_allow_html=True)
     
+    # Main content; rendered before the sidebar so the sidebar shows the
+    # state the chat panel has just synced
+    if not st.session_state.session_id:
+        # Welcome screen
+        col1, col2, col3 = st.columns(WELCOME_COLUMNS)
+        with col2:
+            st.markdown("""
+            <div class="session-info">
+                <h3>🎯 Welcome to MediBook!</h3>
+                <p>Your AI-powered medical appointment booking assistant.</p>
+                <ul>
+                    <li>💬 Natural conversation interface</li>
+                    <li>🤖 AI-powered assistance</li>
+                    <li>📅 Smart appointment scheduling</li>
+                    <li>👨‍⚕️ Multiple doctor specialties</li>
+                </ul>
+                <p><strong>Get started by entering your email in the sidebar!</strong></p>
+            </div>
+            """, unsafe_allow_html=True)
+    else:
+        chat_panel()
+    
     # Sidebar
     with st.sidebar:
         st.header("🔧 Session Control")
@@ -187,8 +417,10 @@ def main():
                     with st.spinner("Creating session..."):
                         session_data = create_booking_session(patient_email)
                         if session_data:
+                            list_sessions.clear()
                             st.session_state.session_id = session_data['session_id']
                             st.session_state.chat_history = []
+                            st.session_state.last_turn = 0
                             st.success("Session created successfully!")
                             st.rerun()
                 else:
@@ -200,8 +432,11 @@ def main():
             st.write(f"**Current Step:** {st.session_state.current_step}")
             
             if st.button("🔄 New Session"):
+                # The next start must create a real new session
+                st.session_state.recent_booking_session = None
                 st.session_state.session_id = None
                 st.session_state.chat_history = []
+                st.session_state.last_turn = 0
                 st.session_state.patient_info = {}
                 st.session_state.current_step = "greeting"
                 st.rerun()
@@ -211,145 +446,21 @@ def main():
         # Quick actions
         st.subheader("⚡ Quick Actions")
         if st.button("📋 View All Sessions"):
-            try:
-                response = requests.get(f"{API_BASE_URL}/sessions")
-                if response.status_code == 200:
-                    sessions = response.json()
-                    st.json(sessions)
-            except:
-                st.error("Failed to fetch sessions")
+            st.session_state.show_sessions = not st.session_state.show_sessions
+            st.session_state.sessions_offset = 0
+        
+        if st.session_state.show_sessions:
+            display_sessions_page()
         
         if st.button("🧹 Cleanup Expired"):
             try:
-                response = requests.post(f"{API_BASE_URL}/cleanup")
+                response = get_http_session().post(f"{API_BASE_URL}/cleanup", timeout=REQUEST_TIMEOUT)
                 if response.status_code == 200:
                     result = response.json()
+                    list_sessions.clear()
                     st.success(result['message'])
             except:
                 st.error("Failed to cleanup sessions")
-    
-    # Main content
-    if not st.session_state.session_id:
-        # Welcome screen
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            st.markdown("""
-            <div class="session-info">
-                <h3>🎯 Welcome to MediBook!</h3>
-                <p>Your AI-powered medical appointment booking assistant.</p>
-                <ul>
-                    <li>💬 Natural conversation interface</li>
-                    <li>🤖 AI-powered assistance</li>
-                    <li>📅 Smart appointment scheduling</li>
-                    <li>👨‍⚕️ Multiple doctor specialties</li>
-                </ul>
-                <p><strong>Get started by entering your email in the sidebar!</strong></p>
-            </div>
-            """, unsafe_allow_html=True)
-    else:
-        # Chat interface
-        col1, col2 = st.columns([2, 1])
-        
-        with col1:
-            st.header("💬 Chat with MediBook Assistant")
-            
-            # Chat history
-            chat_container = st.container()
-            with chat_container:
-                for message in st.session_state.chat_history:
-                    display_chat_message(
-                        message['type'], 
-                        message['content'], 
-                        message.get('timestamp')
-                    )
-            
-            # Chat input
-            with st.form("chat_form", clear_on_submit=True):
-                user_input = st.text_input(
-                    "Type your message here...", 
-                    placeholder="Hi, I'd like to book an appointment",
-                    key="user_input"
-                )
-                col_send, col_clear = st.columns([1, 4])
-                
-                with col_send:
-                    send_button = st.form_submit_button("📤 Send", type="primary")
-                
-                if send_button and user_input:
-                    # Add user message to history
-                    st.session_state.chat_history.append({
-                        'type': 'user',
-                        'content': user_input,
-                        'timestamp': datetime.now().strftime("%H:%M:%S")
-                    })
-                    
-                    # Send to API
-                    with st.spinner("🤖 Assistant is thinking..."):
-                        response = send_chat_message(st.session_state.session_id, user_input)
-                        
-                        if response:
-                            # Add assistant response to history
-                            st.session_state.chat_history.append({
-                                'type': 'assistant',
-                                'content': response['assistant_response'],
-                                'timestamp': datetime.now().strftime("%H:%M:%S")
-                            })
-                            
-                            # Update session state
-                            st.session_state.current_step = response['current_step']
-                            st.session_state.patient_info = response['patient_info']
-                    
-                    st.rerun()
-        
-        with col2:
-            # Patient information panel
-            display_patient_info(st.session_state.patient_info)
-            
-            st.divider()
-            
-            # Available doctors info
-            st.markdown("### 👨‍⚕️ Available Doctors")
-            doctors_info = """
-            **Dr. Smith** - General Medicine  
-            **Dr. Johnson** - Cardiology  
-            **Dr. Brown** - Dermatology  
-            """
-            st.markdown(doctors_info)
-            
-            st.divider()
-            
-            # Booking progress
-            st.markdown("### 📊 Booking Progress")
-            steps = [
-                "Greeting",
-                "Name Collection", 
-                "Phone Collection",
-                "Symptoms Collection",
-                "Doctor Preference",
-                "Slot Selection",
-                "Confirmation",
-                "Completed"
-            ]
-            
-            current_step_index = 0
-            step_mapping = {
-                "greeting": 0,
-                "name_collection": 1,
-                "phone_collection": 2,
-                "symptoms_collection": 3,
-                "doctor_preference": 4,
-                "slot_selection": 5,
-                "confirmation": 6,
-                "completed": 7
-            }
-            
-            current_step_index = step_mapping.get(st.session_state.current_step, 0)
-            
-            for i, step in enumerate(steps):
-                if i <= current_step_index:
-                    st.markdown(f"✅ {step}")
-                else:
-                    st.markdown(f"⏳ {step}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -2,131 +2,207 @@
 Professional test suite for the Medical Appointment Booking API.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import logging.handlers
+import sys
 import requests
-import json
-import time
-from typing import Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
 
+# Replay responses from a local cache instead of the server (set by --cache)
+USE_RESPONSE_CACHE = False
+
+# Test output is buffered and written out at the end of each test; per-step
+# details are logged at DEBUG, which --quiet turns off
+logger = logging.getLogger("medtests")
+logger.setLevel(logging.DEBUG)
+logger.propagate = False
+_log_handler = logging.handlers.MemoryHandler(capacity=1024, target=logging.StreamHandler(sys.stdout))
+logger.addHandler(_log_handler)
+
 class MedicalBookingAPIClient:
-    """Professional API client for testing the medical booking system."""
+    """Professional API client for testing the medical booking system.
+    
+    With ``cache=True`` GET and POST responses are stored on disk with
+    requests-cache for five minutes and identical requests (same URL and
+    body) are answered from it; ``last_from_cache`` tells whether the last
+    response was a cache hit.
+    """
     
-    def __init__(self, base_url: str = "http://localhost:8000"):
+    def __init__(self, base_url: str = "http://localhost:8000", cache: Optional[bool] = None):
         self.base_url = base_url
         self.session_id: Optional[str] = None
+        self.last_from_cache = False
+        
+        # Endpoint URLs are built once; per-session ones are format templates
+        self._url_sessions = f"{base_url}/sessions"
+        self._url_chat = f"{base_url}/chat"
+        self._url_chat_batch = f"{base_url}/chat/batch"
+        self._url_cleanup = f"{base_url}/cleanup"
+        self._url_health = f"{base_url}/health"
+        self._url_chat_history_tpl = f"{base_url}/chat-history/{{}}"
+        self._url_session_tpl = f"{base_url}/sessions/{{}}"
+        
+        if USE_RESPONSE_CACHE if cache is None else cache:
+            import requests_cache
+            self._session = requests_cache.CachedSession(
+                cache_name="medbooking_tests",
+                backend="sqlite",
+                expire_after=300,
+                allowable_methods=("GET", "POST")
+            )
+        else:
+            # One pooled HTTP session so calls reuse keep-alive connections
+            self._session = requests.Session()
+        self._session.hooks["response"].append(self._record_cache_hit)
+        
+        # Transient failures are retried with exponential backoff; the last
+        # response still reaches raise_for_status in _request. 500 is left out: the
+        # chat endpoints return it after a turn may have been applied. Read
+        # timeouts are not retried either, since the server may still apply
+        # the timed-out chat turn
+        retry = Retry(
+            total=3,
+            read=0,
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST"]),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({"Content-Type": "application/json"})
+    
+    def _record_cache_hit(self, response: requests.Response, *args, **kwargs):
+        """Remember whether a response was served from the response cache."""
+        self.last_from_cache = getattr(response, "from_cache", False)
+    
+    def _request(self, method: str, url: str, payload: Any = None, **kwargs) -> Any:
+        """Send a request and return the decoded JSON body.
+        
+        Bodies are encoded and decoded with orjson; the JSON Content-Type
+        header is set on the session. Raises requests.HTTPError for error
+        responses.
+        """
+        if payload is not None:
+            kwargs["data"] = orjson.dumps(payload)
+        response = self._session.request(method, url, **kwargs)
+        response.raise_for_status()
+        return orjson.loads(response.content)
+    
+    def _resolve_sid(self, session_id: Optional[str]) -> str:
+        """Return the given session ID, falling back to the current session."""
+        sid = session_id or self.session_id
+        if sid is None:
+            raise RuntimeError("No session ID available")
+        return sid
     
-    def create_session(self, patient_email: Optional[str] = None) -> Dict:
-        """Create a new booking session."""
-        url = f"{self.base_url}/sessions"
+    def close(self):
+        """Close the pooled HTTP connections."""
+        self._session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def create_session(self, patient_email: Optional[str] = None, make_current: bool = True) -> Dict:
+        """Create a new booking session.
+        
+        With make_current=False the client's current session is left as it
+        is, which keeps concurrent calls from racing on it.
+        """
         payload = {}
         if patient_email:
             payload["patient_email"] = patient_email
         
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            data = response.json()
+        data = self._request("POST", self._url_sessions, payload)
+        if make_current:
             self.session_id = data["session_id"]
-            return data
-        else:
-            raise Exception(f"Failed to create session: {response.text}")
+        return data
     
     def send_message(self, message: str, session_id: Optional[str] = None) -> Dict:
         """Send a chat message."""
-        if not session_id and not self.session_id:
-            raise Exception("No session ID available")
-        
-        url = f"{self.base_url}/chat"
         payload = {
-            "session_id": session_id or self.session_id,
+            "session_id": self._resolve_sid(session_id),
             "message": message
         }
         
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Failed to send message: {response.text}")
+        return self._request("POST", self._url_chat, payload)
     
-    def get_chat_history(self, session_id: Optional[str] = None) -> Dict:
-        """Get chat history for a session."""
-        if not session_id and not self.session_id:
-            raise Exception("No session ID available")
+    def send_messages(self, messages: List[str], session_id: Optional[str] = None) -> List[Dict]:
+        """Send several chat messages in one request; they are processed in order."""
+        payload = {
+            "session_id": self._resolve_sid(session_id),
+            "messages": messages
+        }
         
-        url = f"{self.base_url}/chat-history/{session_id or self.session_id}"
-        response = requests.get(url)
+        return self._request("POST", self._url_chat_batch, payload)
+    
+    def get_chat_history(self, session_id: Optional[str] = None, limit: Optional[int] = None) -> Dict:
+        """Get chat history for a session, optionally only the last `limit` messages."""
+        url = self._url_chat_history_tpl.format(self._resolve_sid(session_id))
+        params = {}
+        if limit:
+            params["limit"] = limit
         
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Failed to get chat history: {response.text}")
+        return self._request("GET", url, params=params)
     
     def get_session_info(self, session_id: Optional[str] = None) -> Dict:
         """Get session information."""
-        if not session_id and not self.session_id:
-            raise Exception("No session ID available")
-        
-        url = f"{self.base_url}/sessions/{session_id or self.session_id}"
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Failed to get session info: {response.text}")
+        url = self._url_session_tpl.format(self._resolve_sid(session_id))
+        return self._request("GET", url)
+    
+    def get_session_summary(self, session_id: Optional[str] = None) -> Tuple[Dict, Dict]:
+        """Fetch session info and chat history concurrently over the pooled session."""
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            session_info = executor.submit(self.get_session_info, session_id)
+            history = executor.submit(self.get_chat_history, session_id)
+            return session_info.result(), history.result()
     
     def list_sessions(self, status: Optional[str] = None) -> Dict:
         """List all sessions."""
-        url = f"{self.base_url}/sessions"
         params = {}
         if status:
             params["status"] = status
         
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Failed to list sessions: {response.text}")
+        return self._request("GET", self._url_sessions, params=params)
     
     def cleanup_sessions(self) -> Dict:
         """Clean up expired sessions."""
-        url = f"{self.base_url}/cleanup"
-        response = requests.post(url)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Failed to cleanup sessions: {response.text}")
+        return self._request("POST", self._url_cleanup)
     
     def health_check(self) -> Dict:
         """Check API health."""
-        url = f"{self.base_url}/health"
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Health check failed: {response.text}")
+        return self._request("GET", self._url_health)
 
 def test_complete_booking_flow():
     """Test complete appointment booking flow."""
-    print("🏥 Testing Complete Medical Appointment Booking Flow")
-    print("=" * 60)
+    logger.info("🏥 Testing Complete Medical Appointment Booking Flow")
+    logger.info("=" * 60)
     
     client = MedicalBookingAPIClient()
     
     try:
         # 1. Health Check
-        print("1. Checking API health...")
+        logger.info("1. Checking API health...")
         health = client.health_check()
-        print(f"   ✅ API Status: {health['status']}")
+        logger.info(f"   ✅ API Status: {health['status']}")
         
         # 2. Create Session
-        print("\n2. Creating new session...")
+        logger.info("\n2. Creating new session...")
         session = client.create_session(patient_email="test@example.com")
-        print(f"   ✅ Session created: {session['session_id']}")
-        print(f"   📅 Expires at: {session['expires_at']}")
+        logger.info(f"   ✅ Session created: {session['session_id']}")
+        logger.info(f"   📅 Expires at: {session['expires_at']}")
         
         # 3. Start conversation
-        print("\n3. Starting conversation...")
+        logger.info("\n3. Starting conversation...")
         messages = [
             "Hello, I'd like to book an appointment",
             "John Doe",
@@ -137,108 +213,121 @@ def test_complete_booking_flow():
             "Yes, please confirm the appointment"
         ]
         
-        for i, message in enumerate(messages, 1):
-            print(f"\n   Step {i}: Sending '{message}'")
-            response = client.send_message(message)
-            print(f"   🤖 Assistant: {response['assistant_response'][:100]}...")
-            print(f"   📍 Current step: {response['current_step']}")
-            
-            # Show patient info progress
-            patient_info = response['patient_info']
-            if patient_info['name']:
-                print(f"   👤 Name: {patient_info['name']}")
-            if patient_info['phone']:
-                print(f"   📞 Phone: {patient_info['phone']}")
-            if patient_info['symptoms']:
-                print(f"   🩺 Symptoms: {patient_info['symptoms'][:50]}...")
-            
-            time.sleep(1)  # Simulate natural conversation pace
+        # The first message goes through POST /chat, the rest in one batch
+        responses = [client.send_message(messages[0])] + client.send_messages(messages[1:])
+        if client.last_from_cache:
+            logger.info("   💾 Responses replayed from the response cache")
+        # Per-step details are only formatted when not running with --quiet
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, (message, response) in enumerate(zip(messages, responses), 1):
+                logger.debug(f"\n   Step {i}: Sent '{message}'")
+                logger.debug(f"   🤖 Assistant: {response['assistant_response'][:100]}...")
+                logger.debug(f"   📍 Current step: {response['current_step']}")
+                
+                # Show patient info progress
+                patient_info = response['patient_info']
+                if patient_info['name']:
+                    logger.debug(f"   👤 Name: {patient_info['name']}")
+                if patient_info['phone']:
+                    logger.debug(f"   📞 Phone: {patient_info['phone']}")
+                if patient_info['symptoms']:
+                    logger.debug(f"   🩺 Symptoms: {patient_info['symptoms'][:50]}...")
         
-        # 4. Get final session info
-        print("\n4. Getting final session information...")
-        session_info = client.get_session_info()
-        print(f"   ✅ Final status: {session_info['status']}")
-        print(f"   📍 Final step: {session_info['current_step']}")
+        # 4. Get final session info and chat history together
+        session_info, history = client.get_session_summary()
+        
+        logger.info("\n4. Getting final session information...")
+        logger.info(f"   ✅ Final status: {session_info['status']}")
+        logger.info(f"   📍 Final step: {session_info['current_step']}")
         
         # 5. Get chat history
-        print("\n5. Retrieving chat history...")
-        history = client.get_chat_history()
-        print(f"   💬 Total messages: {history['total_messages']}")
-        print(f"   👤 Patient: {history['patient_info']['name']}")
-        print(f"   📞 Phone: {history['patient_info']['phone']}")
+        logger.info("\n5. Retrieving chat history...")
+        logger.info(f"   💬 Total messages: {history['total_messages']}")
+        logger.info(f"   👤 Patient: {history['patient_info']['name']}")
+        logger.info(f"   📞 Phone: {history['patient_info']['phone']}")
         
-        print("\n✅ Complete booking flow test PASSED!")
+        logger.info("\n✅ Complete booking flow test PASSED!")
         return True
         
     except Exception as e:
-        print(f"\n❌ Test failed: {str(e)}")
+        logger.error(f"\n❌ Test failed: {str(e)}")
         return False
+    
+    finally:
+        _log_handler.flush()
 
 def test_session_management():
     """Test session management features."""
-    print("\n🔧 Testing Session Management Features")
-    print("=" * 60)
+    logger.info("\n🔧 Testing Session Management Features")
+    logger.info("=" * 60)
     
     client = MedicalBookingAPIClient()
     
     try:
         # Create multiple sessions
-        print("1. Creating multiple sessions...")
-        sessions = []
-        for i in range(3):
-            session = client.create_session(f"user{i}@example.com")
-            sessions.append(session['session_id'])
-            print(f"   ✅ Session {i+1}: {session['session_id']}")
+        logger.info("1. Creating multiple sessions...")
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            sessions = list(executor.map(
+                lambda i: client.create_session(f"user{i}@example.com", make_current=False), range(3)
+            ))
+        for i, session in enumerate(sessions):
+            logger.info(f"   ✅ Session {i+1}: {session['session_id']}")
         
         # List all sessions
-        print("\n2. Listing all sessions...")
+        logger.info("\n2. Listing all sessions...")
         all_sessions = client.list_sessions()
-        print(f"   📊 Total sessions: {all_sessions['total']}")
+        logger.info(f"   📊 Total sessions: {all_sessions['total']}")
         
         # Test cleanup
-        print("\n3. Testing cleanup...")
+        logger.info("\n3. Testing cleanup...")
         cleanup_result = client.cleanup_sessions()
-        print(f"   🧹 {cleanup_result['message']}")
+        logger.info(f"   🧹 {cleanup_result['message']}")
         
-        print("\n✅ Session management test PASSED!")
+        logger.info("\n✅ Session management test PASSED!")
         return True
         
     except Exception as e:
-        print(f"\n❌ Session management test failed: {str(e)}")
+        logger.error(f"\n❌ Session management test failed: {str(e)}")
         return False
+    
+    finally:
+        _log_handler.flush()
 
 def test_error_handling():
     """Test error handling scenarios."""
-    print("\n⚠️  Testing Error Handling")
-    print("=" * 60)
+    logger.info("\n⚠️  Testing Error Handling")
+    logger.info("=" * 60)
     
     client = MedicalBookingAPIClient()
     
     try:
         # Test invalid session
-        print("1. Testing invalid session ID...")
+        logger.info("1. Testing invalid session ID...")
         try:
             client.send_message("Hello", session_id="invalid-session-id")
-            print("   ❌ Should have failed!")
+            logger.info("   ❌ Should have failed!")
             return False
         except Exception as e:
-            print(f"   ✅ Correctly handled invalid session: {str(e)[:50]}...")
+            logger.info(f"   ✅ Correctly handled invalid session: {str(e)[:50]}...")
         
         # Test missing session
-        print("\n2. Testing missing session...")
+        logger.info("\n2. Testing missing session...")
         try:
             client.get_session_info("nonexistent-session")
-            print("   ❌ Should have failed!")
+            logger.info("   ❌ Should have failed!")
             return False
         except Exception as e:
-            print(f"   ✅ Correctly handled missing session: {str(e)[:50]}...")
+            logger.info(f"   ✅ Correctly handled missing session: {str(e)[:50]}...")
         
-        print("\n✅ Error handling test PASSED!")
+        logger.info("\n✅ Error handling test PASSED!")
         return True
         
     except Exception as e:
-        print(f"\n❌ Error handling test failed: {str(e)}")
+        logger.error(f"\n❌ Error handling test failed: {str(e)}")
         return False
+    
+    finally:
+        _log_handler.flush()
 
 def interactive_test():
     """Interactive test mode for manual testing."""
@@ -261,9 +350,9 @@ def interactive_test():
             if user_input.lower() == 'quit':
                 break
             elif user_input.lower() == 'history':
-                history = client.get_chat_history()
+                history = client.get_chat_history(limit=5)
                 print(f"\n💬 Chat History ({history['total_messages']} messages):")
-                for msg in history['messages'][-5:]:  # Show last 5 messages
+                for msg in history['messages']:  # Server returns only the last 5
                     icon = "👤" if msg['message_type'] == 'user' else "🤖"
                     print(f"   {icon} {msg['content'][:80]}...")
                 continue
@@ -329,7 +418,13 @@ def run_all_tests():
     return passed == total
 
 if __name__ == "__main__":
-    import sys
+    if "--cache" in sys.argv:
+        sys.argv.remove("--cache")
+        USE_RESPONSE_CACHE = True
+    
+    if "--quiet" in sys.argv:
+        sys.argv.remove("--quiet")
+        logger.setLevel(logging.INFO)
     
     if len(sys.argv) > 1 and sys.argv[1] == "interactive":
         interactive_test()